@@ -18,7 +18,7 @@
  #
 
 __all__ = ["apache", "cgihandler", "psp",
-           "publisher", "util", "python22", "version"]
+           "publisher", "util", "python22", "version", "watcher"]
 
 # This is used by mod_python.c to make sure the version of C
 # code matches the Python code.
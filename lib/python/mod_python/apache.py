@@ -28,6 +28,7 @@ import imp
 import types
 import cgi
 import _apache
+import watcher
 
 try:
     import threading
@@ -38,6 +39,179 @@ except:
 _path_cache = {}
 _path_cache_lock = threading.Lock()
 
+# Cache of dispatch plans, see _get_dispatch_plan().
+_plan_cache = {}
+_plan_cache_lock = threading.Lock()
+
+# Cache of compiled SSI code, see _get_include_code().
+_include_cache = {}
+_include_cache_size = 256
+_include_cache_lock = threading.Lock()
+
+class _DispatchPlan:
+    """
+    Everything about a handler that does not change from one
+    request to the next: the parsed module::object string, the
+    directive values that affect dispatching and the object most
+    recently found in the module.
+    """
+
+    def __init__(self, handler, default_obj_str, directory, config):
+
+        # split module::handler
+        l = handler.split('::', 1)
+        self.module_name = l[0]
+        if len(l) == 1:
+            # no object, provide default
+            self.obj_str = default_obj_str
+        else:
+            self.obj_str = l[1]
+
+        self.debug = config.get("PythonDebug") == "1"
+        self.autoreload = config.get("PythonAutoReload", "1") == "1"
+
+        # Only permit debugging using pdb if Apache has
+        # actually been started in single process mode.
+        self.pdb_debug = (config.get("PythonEnablePdb") == "1" and
+                          exists_config_define("ONE_PROCESS"))
+
+        # evaluate pythonpath and set sys.path to
+        # resulting value if not already done, or
+        # remember the directory, which add_path()
+        # adds to pythonpath if not there yet
+
+        self.directory = None
+        if "PythonPath" in config:
+            _path_cache_lock.acquire()
+            try:
+                pathstring = config["PythonPath"]
+                if pathstring not in _path_cache:
+                    newpath = eval(pathstring)
+                    _path_cache[pathstring] = None
+                    sys.path[:] = newpath
+            finally:
+                _path_cache_lock.release()
+        else:
+            self.directory = directory
+
+        self.obj = None
+
+    def add_path(self):
+        """
+        Add the directory to sys.path if it is not there. This is
+        checked on every dispatch since another handler's PythonPath
+        may have replaced sys.path since.
+        """
+
+        directory = self.directory
+        if directory and directory not in sys.path:
+            _path_cache_lock.acquire()
+            try:
+                if directory not in sys.path:
+                    sys.path[:0] = [directory]
+            finally:
+                _path_cache_lock.release()
+
+    def resolve(self, arg, silent=0):
+        """
+        Import (or reimport) the module and return the object
+        to call. Simple object names are looked up in the module
+        dictionary and reused for as long as the module still
+        holds the same object, i.e. until it is reloaded.
+        """
+
+        self.add_path()
+
+        # import_module() returns modules which are completely
+        # imported, and fresh, without taking any lock
+        module = import_module(self.module_name,
+                               autoreload=self.autoreload,
+                               log=self.debug)
+
+        if '.' not in self.obj_str: # this is an optimization
+            obj = module.__dict__.get(self.obj_str)
+            if obj is not None and obj is self.obj:
+                return obj
+            obj = resolve_object(module, self.obj_str,
+                                 arg=arg, silent=silent)
+            # a bound method of a freshly created instance
+            # never matches the module dictionary above
+            self.obj = obj
+            return obj
+
+        return resolve_object(module, self.obj_str,
+                              arg=arg, silent=silent)
+
+def _get_dispatch_plan(handler, default_obj_str, directory, config):
+    """
+    Return the dispatch plan for handler, building it if needed.
+    Plans are keyed by handler, directory and the values of the
+    directives they depend on, so a configuration change simply
+    results in a different plan.
+    """
+
+    key = (handler, default_obj_str, directory,
+           config.get("PythonPath"), config.get("PythonDebug"),
+           config.get("PythonAutoReload"), config.get("PythonEnablePdb"))
+
+    try:
+        return _plan_cache[key]
+    except KeyError:
+        plan = _DispatchPlan(handler, default_obj_str, directory, config)
+        _plan_cache_lock.acquire()
+        try:
+            return _plan_cache.setdefault(key, plan)
+        finally:
+            _plan_cache_lock.release()
+
+def _get_include_code(tag, code):
+    """
+    Return the code of a server side include 'eval' or 'exec'
+    tag compiled, compiling it only the first time it is seen.
+    """
+
+    key = (tag, code)
+    try:
+        return _include_cache[key]
+    except KeyError:
+        compiled = compile(code, "<string>", tag)
+        _include_cache_lock.acquire()
+        try:
+            if len(_include_cache) >= _include_cache_size:
+                # keyed by the code itself, so keep it bounded
+                _include_cache.clear()
+            return _include_cache.setdefault(key, compiled)
+        finally:
+            _include_cache_lock.release()
+
+def _call_handler(plan, obj, arg):
+    """
+    Call the handler object, under pdb if the plan says so.
+    """
+
+    if plan.pdb_debug:
+
+        # Don't use pdb.runcall() as it results in
+        # a bogus 'None' response when pdb session
+        # is quit. With this code the exception
+        # marking that the session has been quit is
+        # propogated back up and it is obvious in
+        # the error message what actually occurred.
+
+        debugger = pdb.Pdb()
+        debugger.reset()
+        sys.settrace(debugger.trace_dispatch)
+
+        try:
+            return obj(arg)
+
+        finally:
+            debugger.quitting = 1
+            sys.settrace(None)
+
+    else:
+        return obj(arg)
+
 _result_warning = """Handler has returned result or raised SERVER_RETURN
 exception with argument having non integer type. Type of value returned
 was %s, whereas expected """ + str(types.IntType) + "."
@@ -69,77 +243,20 @@ class CallBack:
     def ConnectionDispatch(self, conn):
 
         # config
-        config, debug  = conn.base_server.get_config(), False
-        if "PythonDebug" in config:
-            debug = config["PythonDebug"] == "1"
+        config = conn.base_server.get_config()
+        debug = config.get("PythonDebug") == "1"
 
         try:
 
             handler = conn.hlist.handler
 
-            # split module::handler
-            l = handler.split('::', 1)
-            module_name = l[0]
-            if len(l) == 1:
-                # no oject, provide default
-                obj_str = "connectionhandler"
-            else:
-                obj_str = l[1]
+            plan = _get_dispatch_plan(handler, "connectionhandler",
+                                      None, config)
 
-            # evaluate pythonpath and set sys.path to
-            # resulting value if not already done
-
-            if "PythonPath" in config:
-                _path_cache_lock.acquire()
-                try:
-                    pathstring = config["PythonPath"]
-                    if pathstring not in _path_cache:
-                        newpath = eval(pathstring)
-                        _path_cache[pathstring] = None
-                        sys.path[:] = newpath
-                finally:
-                    _path_cache_lock.release()
-
-            # import module
-            autoreload = True
-            if "PythonAutoReload" in config:
-                autoreload = config["PythonAutoReload"] == "1"
-            module = import_module(module_name,
-                                   autoreload=autoreload,
-                                   log=debug)
             # find the object
-            obj = resolve_object(module, obj_str,
-                                    arg=conn, silent=0)
-
-            # Only permit debugging using pdb if Apache has
-            # actually been started in single process mode.
-
-            pdb_debug = False
-            if "PythonEnablePdb" in config:
-                pdb_debug = config["PythonEnablePdb"] == "1"
-
-            if pdb_debug and exists_config_define("ONE_PROCESS"):
-
-                # Don't use pdb.runcall() as it results in
-                # a bogus 'None' response when pdb session
-                # is quit. With this code the exception
-                # marking that the session has been quit is
-                # propogated back up and it is obvious in
-                # the error message what actually occurred.
+            obj = plan.resolve(conn)
 
-                debugger = pdb.Pdb()
-                debugger.reset()
-                sys.settrace(debugger.trace_dispatch)
-
-                try:
-                    result = obj(conn)
-
-                finally:
-                    debugger.quitting = 1
-                    sys.settrace(None)
-
-            else:
-                result = obj(conn)
+            result = _call_handler(plan, obj, conn)
 
             assert (result.__class__ is types.IntType), \
                    "ConnectionHandler '%s' returned invalid return code." % handler
@@ -171,89 +288,23 @@ class CallBack:
         req = filter.req
 
         # config
-        config, debug  = req.get_config(), False
-        if "PythonDebug" in config:
-            debug = config["PythonDebug"] == "1"
+        config = req.get_config()
+        debug = config.get("PythonDebug") == "1"
 
         try:
 
-            # split module::handler
-            l = filter.handler.split('::', 1)
-            module_name = l[0]
-            if len(l) == 1:
-                # no oject, provide default
-                if filter.is_input:
-                    obj_str = "inputfilter"
-                else:
-                    obj_str = "outputfilter"
+            if filter.is_input:
+                default_obj_str = "inputfilter"
             else:
-                obj_str = l[1]
-
-            # add the directory to pythonpath if
-            # not there yet, or evaluate pythonpath
-            # and set sys.path to resulting value
-            # if not already done
+                default_obj_str = "outputfilter"
 
-            if "PythonPath" in config:
-                _path_cache_lock.acquire()
-                try:
-                    pathstring = config["PythonPath"]
-                    if pathstring not in _path_cache:
-                        newpath = eval(pathstring)
-                        _path_cache[pathstring] = None
-                        sys.path[:] = newpath
-                finally:
-                    _path_cache_lock.release()
-            else:
-                if filter.dir:
-                    _path_cache_lock.acquire()
-                    try:
-                        if filter.dir not in sys.path:
-                            sys.path[:0] = [filter.dir]
-                    finally:
-                        _path_cache_lock.release()
-
-            # import module
-            autoreload = True
-            if "PythonAutoReload" in config:
-                autoreload = config["PythonAutoReload"] == "1"
-            module = import_module(module_name,
-                                   autoreload=autoreload,
-                                   log=debug)
+            plan = _get_dispatch_plan(filter.handler, default_obj_str,
+                                      filter.dir, config)
 
             # find the object
-            obj = resolve_object(module, obj_str,
-                                    arg=filter, silent=0)
-
-            # Only permit debugging using pdb if Apache has
-            # actually been started in single process mode.
-
-            pdb_debug = False
-            if "PythonEnablePdb" in config:
-                pdb_debug = config["PythonEnablePdb"] == "1"
+            obj = plan.resolve(filter)
 
-            if pdb_debug and exists_config_define("ONE_PROCESS"):
-
-                # Don't use pdb.runcall() as it results in
-                # a bogus 'None' response when pdb session
-                # is quit. With this code the exception
-                # marking that the session has been quit is
-                # propogated back up and it is obvious in
-                # the error message what actually occurred.
-
-                debugger = pdb.Pdb()
-                debugger.reset()
-                sys.settrace(debugger.trace_dispatch)
-
-                try:
-                    result = obj(filter)
-
-                finally:
-                    debugger.quitting = 1
-                    sys.settrace(None)
-
-            else:
-                result = obj(filter)
+            result = _call_handler(plan, obj, filter)
 
             # always flush the filter. without a FLUSH or EOS bucket,
             # the content is never written to the network.
@@ -315,9 +366,8 @@ class CallBack:
         result = HTTP_INTERNAL_SERVER_ERROR
 
         # config
-        config, debug = req.get_config(), False
-        if "PythonDebug" in config:
-            debug = config["PythonDebug"] == "1"
+        config = req.get_config()
+        debug = config.get("PythonDebug") == "1"
 
         default_obj_str = _phase_handler_names[req.phase]
 
@@ -331,94 +381,20 @@ class CallBack:
 
             while hlist.handler is not None:
 
-                # split module::handler
-                l = hlist.handler.split('::', 1)
+                directory = None
+                if not hlist.is_location:
+                    directory = hlist.directory
 
-                module_name = l[0]
-                if len(l) == 1:
-                    # no object, provide default
-                    obj_str = default_obj_str
-                else:
-                    obj_str = l[1]
-
-                # add the directory to pythonpath if
-                # not there yet, or evaluate pythonpath
-                # and set sys.path to resulting value
-                # if not already done
-
-                if "PythonPath" in config:
-                    _path_cache_lock.acquire()
-                    try:
-                        pathstring = config["PythonPath"]
-                        if pathstring not in _path_cache:
-                            newpath = eval(pathstring)
-                            _path_cache[pathstring] = None
-                            sys.path[:] = newpath
-                    finally:
-                        _path_cache_lock.release()
-                else:
-                    if not hlist.is_location:
-                        directory = hlist.directory
-                        if directory:
-                            _path_cache_lock.acquire()
-                            try:
-                                if directory not in sys.path:
-                                    sys.path[:0] = [directory]
-                            finally:
-                                _path_cache_lock.release()
-
-                # import module
-                autoreload = True
-                if "PythonAutoReload" in config:
-                    autoreload = config["PythonAutoReload"] == "1"
-                module = import_module(module_name,
-                                       autoreload=autoreload,
-                                       log=debug)
+                plan = _get_dispatch_plan(hlist.handler, default_obj_str,
+                                          directory, config)
 
                 # find the object
-                if '.' not in obj_str: # this is an optimization
-                    try:
-                        obj = module.__dict__[obj_str]
-                    except:
-                        if not hlist.silent:
-                            s = "module '%s' contains no '%s'" % (module.__file__, obj_str)
-                            raise AttributeError, s
-                else:
-                    obj = resolve_object(module, obj_str,
-                                         arg=req, silent=hlist.silent)
+                obj = plan.resolve(req, silent=hlist.silent)
 
                 if not hlist.silent or obj is not None:
 
                     try:
-                        # Only permit debugging using pdb if Apache has
-                        # actually been started in single process mode.
-
-                        pdb_debug = False
-                        if "PythonEnablePdb" in config:
-                            pdb_debug = config["PythonEnablePdb"] == "1"
-
-                        if pdb_debug and exists_config_define("ONE_PROCESS"):
-
-                            # Don't use pdb.runcall() as it results in
-                            # a bogus 'None' response when pdb session
-                            # is quit. With this code the exception
-                            # marking that the session has been quit is
-                            # propogated back up and it is obvious in
-                            # the error message what actually occurred.
-
-                            debugger = pdb.Pdb()
-                            debugger.reset()
-                            sys.settrace(debugger.trace_dispatch)
-
-                            try:
-                                result = obj(req)
-
-                            finally:
-                                debugger.quitting = 1
-                                sys.settrace(None)
-
-                        else:
-                            result = obj(req)
+                        result = _call_handler(plan, obj, req)
 
                     except SERVER_RETURN, value:
 
@@ -476,9 +452,7 @@ class CallBack:
 
         try:
             # config
-            config, debug = filter.req.get_config(), False
-            if "PythonDebug" in config:
-                debug = config["PythonDebug"] == "1"
+            debug = filter.req.get_config().get("PythonDebug") == "1"
 
             if not hasattr(filter.req,"ssi_globals"):
                 filter.req.ssi_globals = {}
@@ -489,11 +463,12 @@ class CallBack:
             code = code.replace('\r\n', '\n').rstrip()
 
             if tag == 'eval':
-                result = eval(code, filter.req.ssi_globals)
+                result = eval(_get_include_code(tag, code),
+                              filter.req.ssi_globals)
                 if result is not None:
                     filter.write(str(result))
             elif tag == 'exec':
-                exec(code, filter.req.ssi_globals)
+                exec(_get_include_code(tag, code), filter.req.ssi_globals)
 
             filter.flush()
 
@@ -602,6 +577,76 @@ class CallBack:
             etb = None
             # we do not return anything
 
+# Locks serializing the (re)import of individual modules, keyed by
+# module name, and the number of times a thread had to wait for one
+# or fell back to the global import lock.
+_import_locks = {}
+_import_locks_lock = threading.Lock()
+_import_lock_waits = 0
+
+def _count_import_lock_wait():
+    global _import_lock_waits
+    _import_locks_lock.acquire()
+    try:
+        _import_lock_waits += 1
+    finally:
+        _import_locks_lock.release()
+
+def _module_is_fresh(module, autoreload, path):
+    """
+    True if module can be returned by import_module() as is,
+    without checking its modification time or reimporting it.
+    """
+
+    # imp.load_module() puts a module in sys.modules before its code
+    # runs, so only a module which _import_module() has marked with
+    # __mtime__ once done is known to be completely imported
+    if "__mtime__" not in module.__dict__:
+        return False
+
+    if not autoreload:
+        return True
+
+    file = module.__dict__.get("__file__")
+    if not file or (path and not filter(file.startswith, path)):
+        return False
+
+    if watcher.running():
+        # module_mtime() only stats files the watcher saw change
+        return module.__dict__.get("__mtime__", 0) == module_mtime(module)
+
+    last_check = module.__dict__.get("__mtime_check__", 0)
+    return (time.time() - last_check) <= 1
+
+def _acquire_import_lock(module_name):
+    """
+    Acquire the lock for module_name, counting the times
+    we have to wait for it. Returns the lock.
+    """
+
+    lock = _import_locks.get(module_name)
+    if lock is None:
+        _import_locks_lock.acquire()
+        try:
+            lock = _import_locks.setdefault(module_name, threading.Lock())
+        finally:
+            _import_locks_lock.release()
+
+    if not lock.acquire(0):
+        _count_import_lock_wait()
+        lock.acquire()
+
+    return lock
+
+def import_lock_waits():
+    """
+    Return the number of times import_module() had to
+    wait for another thread (re)importing the same module,
+    or used the global import lock because an import was
+    in progress.
+    """
+    return _import_lock_waits
+
 def import_module(module_name, autoreload=1, log=0, path=None):
     """
     Get the module to handle the request. If
@@ -609,58 +654,98 @@ def import_module(module_name, autoreload=1, log=0, path=None):
     if it has changed since the last import.
     """
 
-    # nlehuen: this is a big lock, we'll have to refine it later to get better performance.
-    # For now, we'll concentrate on thread-safety.
-    imp.acquire_lock()
-    try:
-        # (Re)import
-        if module_name in sys.modules:
+    # Modules that are already imported and fresh are
+    # returned without taking any lock.
+    module = sys.modules.get(module_name)
+    if module is not None and _module_is_fresh(module, autoreload, path):
+        return module
 
-            # The module has been imported already
-            module = sys.modules[module_name]
-            oldmtime, mtime  = 0, 0
+    # Otherwise serialize on a lock for this module name only. But
+    # imp.lock_held() is true while any thread holds the import
+    # lock, which includes this one if we are running within the
+    # import of another module. Waiting on a module lock could then
+    # deadlock against a thread that holds it and waits for the
+    # import lock, so use the (reentrant) import lock instead. As
+    # this usually means waiting for an unrelated import in another
+    # thread, it is counted as a wait.
+    if imp.lock_held():
+        _count_import_lock_wait()
+        imp.acquire_lock()
+        try:
+            return _import_module(module_name, autoreload, log, path)
+        finally:
+            imp.release_lock()
 
-            if autoreload:
+    lock = _acquire_import_lock(module_name)
+    try:
+        return _import_module(module_name, autoreload, log, path)
+    finally:
+        lock.release()
 
-                # but is it in the path?
-                try:
-                    file = module.__dict__["__file__"]
-                except KeyError:
-                    file = None
+def _import_module(module_name, autoreload, log, path):
+    """
+    The body of import_module(), called with the
+    lock for module_name held.
+    """
 
-                # the "and not" part of this condition is to prevent execution
-                # of arbitrary already imported modules, such as os. The
-                # reason we use startswith as opposed to exact match is that
-                # modules inside packages are actually in subdirectories.
+    # (Re)import
+    if module_name in sys.modules:
 
-                if not file or (path and not filter(file.startswith, path)):
-                    # there is a script by this name already imported, but it's in
-                    # a different directory, therefore it's a different script
-                    mtime, oldmtime = 0, -1 # trigger import
-                else:
-                    try:
-                        last_check = module.__dict__["__mtime_check__"]
-                    except KeyError:
-                        last_check = 0
+        # The module has been imported already
+        module = sys.modules[module_name]
+        oldmtime, mtime  = 0, 0
 
-                    if (time.time() - last_check) > 1:
-                        oldmtime = module.__dict__.get("__mtime__", 0)
-                        mtime = module_mtime(module)
+        if autoreload:
+
+            # but is it in the path?
+            try:
+                file = module.__dict__["__file__"]
+            except KeyError:
+                file = None
+
+            # the "and not" part of this condition is to prevent execution
+            # of arbitrary already imported modules, such as os. The
+            # reason we use startswith as opposed to exact match is that
+            # modules inside packages are actually in subdirectories.
+
+            if not file or (path and not filter(file.startswith, path)):
+                # there is a script by this name already imported, but it's in
+                # a different directory, therefore it's a different script
+                mtime, oldmtime = 0, -1 # trigger import
             else:
-                pass
-        else:
-            mtime, oldmtime = 0, -1
+                try:
+                    last_check = module.__dict__["__mtime_check__"]
+                except KeyError:
+                    last_check = 0
+
+                if watcher.running() or (time.time() - last_check) > 1:
+                    oldmtime = module.__dict__.get("__mtime__", 0)
+                    mtime = module_mtime(module)
+                    if mtime != oldmtime:
+                        # keep other threads off the lock-free path
+                        # until the module has been reloaded
+                        module.__dict__["__mtime_check__"] = 0
+        elif "__mtime__" not in module.__dict__:
+            # imported by other means, possibly still by another
+            # thread, which holds the import lock until it is done
+            imp.acquire_lock()
+            imp.release_lock()
+            module.__dict__.setdefault("__mtime__", 0)
+    else:
+        mtime, oldmtime = 0, -1
 
-        if mtime != oldmtime:
+    if mtime != oldmtime:
 
-            # Import the module
-            if log:
-                if path:
-                    s = "mod_python: (Re)importing module '%s' with path set to '%s'" % (module_name, path)
-                else:
-                    s = "mod_python: (Re)importing module '%s'" % module_name
-                _apache.log_error(s, APLOG_NOTICE)
+        # Import the module
+        if log:
+            if path:
+                s = "mod_python: (Re)importing module '%s' with path set to '%s'" % (module_name, path)
+            else:
+                s = "mod_python: (Re)importing module '%s'" % module_name
+            _apache.log_error(s, APLOG_NOTICE)
 
+        imp.acquire_lock()
+        try:
             parent = None
             parts = module_name.split('.')
             for i in range(len(parts)):
@@ -676,14 +761,18 @@ def import_module(module_name, autoreload=1, log=0, path=None):
                 if hasattr(module, "__path__"):
                     path = module.__path__
 
+            # marks the module as completely imported, still under
+            # the import lock as a thread waiting for it may look
             if mtime == 0:
                 mtime = module_mtime(module)
+            else:
+                module.__dict__["__mtime_check__"] = time.time()
 
             module.__mtime__ = mtime
+        finally:
+            imp.release_lock()
 
-        return module
-    finally:
-        imp.release_lock()
+    return module
 
 def module_mtime(module):
     """Get modification time of module"""
@@ -692,19 +781,12 @@ def module_mtime(module):
 
         filepath = module.__file__
 
-        try:
-            # this try/except block is a workaround for a Python bug in
-            # 2.0, 2.1 and 2.1.1. See
-            # http://sourceforge.net/tracker/?group_id=5470&atid=105470&func=detail&aid=422004
+        # watcher.mtime() returns None for files that do not exist
+        # and, if the watcher is running, stats only changed files
 
-            if os.path.exists(filepath):
-                mtime = os.path.getmtime(filepath)
+        mtime = max(watcher.mtime(filepath), watcher.mtime(filepath[:-1]), 0)
 
-            if os.path.exists(filepath[:-1]) :
-                mtime = max(mtime, os.path.getmtime(filepath[:-1]))
-
-            module.__dict__["__mtime_check__"] = time.time()
-        except OSError: pass
+        module.__dict__["__mtime_check__"] = time.time()
 
     return mtime
 
@@ -826,25 +908,8 @@ class CGIStdin(NullIO):
         if n == 0:
             return ""
 
-        # fill up the buffer
-        self.buf = self.buf + self.req.read(self.BLOCK)
-
-        # look for \n in the buffer
-        i = self.buf.find('\n')
-        while i == -1: # if \n not found - read more
-            if (n != -1) and (len(self.buf) >= n): # we're past n
-                i = n - 1
-                break
-            x = len(self.buf)
-            self.buf = self.buf + self.req.read(self.BLOCK)
-            if len(self.buf) == x: # nothing read, eof
-                i = x - 1
-                break
-            i = self.buf.find('\n', x)
-
-        # carve out the piece, then shorten the buffer
-        result = self.buf[:i+1]
-        self.buf = self.buf[i+1:]
+        # the request object buffers the input
+        result = self.req.readline(n)
         self.pos = self.pos + len(result)
         return result
 
@@ -964,6 +1029,13 @@ def init(name, server):
 
     sys.argv = ["mod_python"]
 
+    # start watching source files for changes if asked to
+    options = server.get_options()
+    if "mod_python.watcher.interval" in options:
+        interval = float(options["mod_python.watcher.interval"])
+        if interval > 0:
+            watcher.start(interval)
+
     global _callback
     _callback = CallBack()
     return _callback
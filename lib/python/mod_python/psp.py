@@ -18,17 +18,29 @@
  # This file originally written by Sterling Hughes
  #
 
-import apache, Session, util, _psp
+import apache, Session, util, watcher, _psp
 import _apache
 
 import sys
 import os
+import time
+import imp
 import marshal
 import new
 from cgi import escape
 import anydbm, whichdb
 import tempfile
 
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+try:
+    from threading import Lock
+except ImportError:
+    from dummy_threading import Lock
+
 # dbm types for cache
 dbm_types = {}
 
@@ -56,6 +68,36 @@ def str2code(s):
 
     return new.code(*marshal.loads(s))
 
+class _InstanceInfo:
+
+    def __init__(self, label, file, cache):
+        self.label = label
+        self.file = file
+        self.cache = cache
+        self.children = {}
+
+# the part of the scope psp code runs in which is the same for every
+# request, by code object, emptied when it holds more than
+# base_scopes_size of them
+base_scopes = {}
+base_scopes_size = 512
+
+def base_scope(code):
+    """
+    Return a snapshot of the globals of this module, which is what
+    psp code has always been able to see, including through eval,
+    exec or globals(). It is taken once for given code and must not
+    be modified, the scope of a request is a copy.
+    """
+
+    scope = base_scopes.get(code)
+    if scope is None:
+        scope = globals().copy()
+        if len(base_scopes) >= base_scopes_size:
+            base_scopes.clear()
+        base_scopes[code] = scope
+    return scope
+
 class PSPInterface:
 
     def __init__(self, req, filename, form):
@@ -75,12 +117,13 @@ class PSPInterface:
 
     def apply_data(self, object):
 
-        if not self.form:
+        if self.form is None:
             if not hasattr(self.req, 'form'):
                 # no existing form, so need to create one,
                 # form has to be saved back to request object
                 # so that error page can access it if need be
-                self.form = util.FieldStorage(self.req, keep_blank_values=1)
+                self.form = util.FieldStorage(self.req, keep_blank_values=1,
+                                              lazy=util.lazy_form(self.req))
                 self.req.form = self.form
             else:
                 self.form = self.req.form
@@ -95,6 +138,7 @@ class PSP:
 
     code = None
     dbmcache = None
+    cache_dir = None
 
     def __init__(self, req, filename=None, string=None, vars={}):
 
@@ -123,8 +167,10 @@ class PSP:
             if cached:
                 self.code = cached
             else:
+                start = time.time()
                 source = _psp.parsestring(string)
                 code = compile(source, "__psp__", "exec")
+                mem_scache.compiled(time.time() - start)
                 mem_scache.store(string,code)
                 self.code = code
 
@@ -138,6 +184,26 @@ class PSP:
             # of mod_python prior to 3.3.
             self.dbmcache = opts["PSPDbmCache"]
 
+        self.cache_dir = opts.get("mod_python.psp.cache_dir")
+
+        global mem_fcache_limits_set
+        if not mem_fcache_limits_set:
+            # the cache belongs to the interpreter, so its limits
+            # are taken from the first request using it only
+            mem_fcache_limits_set = True
+            size = opts.get("mod_python.psp.cache_size")
+            max_bytes = opts.get("mod_python.psp.cache_max_bytes")
+            if size:
+                size = int(size)
+                if size < 1:
+                    # unlike cache_max_bytes, 0 would not mean no
+                    # limit but no cache at all
+                    self.req.log_error("PSP ignores mod_python.psp.cache_size"
+                                       " %d, it must be at least 1" % size,
+                                       apache.APLOG_WARNING)
+                    size = None
+            mem_fcache.set_limits(size, max_bytes and int(max_bytes))
+
         if self.dbmcache:
             cached = dbm_cache_get(self.req.server, self.dbmcache,
                                    filename, mtime)
@@ -148,6 +214,9 @@ class PSP:
         if cached:
             return cached
 
+        if self.cache_dir:
+            return dir_cache_get(self.cache_dir, filename)
+
     def cache_store(self, filename, mtime, code):
 
         if self.dbmcache:
@@ -175,7 +244,13 @@ class PSP:
         if not os.path.isfile(filename):
             raise apache.SERVER_RETURN, apache.HTTP_NOT_FOUND
 
-        mtime = os.path.getmtime(filename)
+        if watcher.running():
+            # the watcher only stats the file if it has changed
+            mtime = watcher.mtime(filename)
+            if mtime is None:
+                raise apache.SERVER_RETURN, apache.HTTP_NOT_FOUND
+        else:
+            mtime = os.path.getmtime(filename)
 
         # check cache
         code = self.cache_get(filename, mtime)
@@ -186,9 +261,19 @@ class PSP:
 
         # finally parse and compile
         if not code:
+            if self.cache_dir:
+                # before parsing, so that a change made while parsing
+                # makes the cached code out of date
+                st = os.stat(filename)
+
+            start = time.time()
             dir, fname = path_split(self.filename)
             source = _psp.parse(fname, dir)
             code = compile(source, filename, "exec")
+            mem_fcache.compiled(time.time() - start)
+
+            if self.cache_dir:
+                dir_cache_store(self.req, self.cache_dir, filename, st, code)
 
         # store in cache
         self.cache_store(filename, mtime, code)
@@ -215,7 +300,8 @@ class PSP:
                 # no existing form, so need to create one,
                 # form has to be saved back to request object
                 # so that error page can access it if need be
-                form = util.FieldStorage(req, keep_blank_values=1)
+                form = util.FieldStorage(req, keep_blank_values=1,
+                                         lazy=util.lazy_form(req))
                 req.form = form
             else:
                 form = req.form
@@ -224,8 +310,10 @@ class PSP:
         psp = PSPInterface(req, self.filename, form)
 
         try:
-            global_scope = globals().copy()
-            global_scope.update({"req":req, "form":form, "psp":psp})
+            global_scope = base_scope(code).copy()
+            global_scope["req"] = req
+            global_scope["form"] = form
+            global_scope["psp"] = psp
 
             # strictly speaking, session attribute only needs
             # to be populated if referenced, but historically
@@ -233,20 +321,14 @@ class PSP:
             # preserve that just in case changing it breaks
             # some users code
             if hasattr(req, 'session'):
-                global_scope.update({"session":req.session})
+                global_scope["session"] = req.session
             else:
-                global_scope.update({"session":None})
-
-            global_scope.update(self.vars) # passed in __init__()
-            global_scope.update(vars)      # passed in run()
+                global_scope["session"] = None
 
-            class _InstanceInfo:
-
-                def __init__(self, label, file, cache):
-                    self.label = label
-                    self.file = file
-                    self.cache = cache
-                    self.children = {}
+            if self.vars:
+                global_scope.update(self.vars) # passed in __init__()
+            if vars:
+                global_scope.update(vars)      # passed in run()
 
             global_scope["__file__"] = req.filename
             global_scope["__mp_info__"] = _InstanceInfo(
@@ -416,55 +498,212 @@ def dbm_cache_get(srv, dbmfile, filename, mtime):
         _apache._global_unlock(srv, None, 0)
 
 
-class HitsCache:
+def dir_cache_path(cache_dir, filename):
 
-    def __init__(self, size=512):
+    return os.path.join(cache_dir, md5(filename).hexdigest() + ".pspc")
+
+def dir_cache_get(cache_dir, filename):
+    """
+    Return the code of filename cached in directory cache_dir if it
+    is still current, else None. No lock is needed since cache files
+    are only ever replaced as a whole.
+    """
+
+    try:
+        st = os.stat(filename)
+        f = open(dir_cache_path(cache_dir, filename), "rb")
+        try:
+            if marshal.load(f) == (imp.get_magic(), filename,
+                                   st.st_mtime, st.st_size):
+                return marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        # not cached, or the file is unreadable
+        pass
+
+    return None
+
+def dir_cache_store(req, cache_dir, filename, st, code):
+    """
+    Store the code compiled from filename, whose os.stat() result
+    before parsing was st, in directory cache_dir. It is written to a
+    temporary file which is then renamed, so that other processes
+    never see a partly written file.
+    """
+
+    header = (imp.get_magic(), filename, st.st_mtime, st.st_size)
+    try:
+        fd, tmp = tempfile.mkstemp(".tmp", "", cache_dir)
+        try:
+            f = os.fdopen(fd, "wb")
+            try:
+                marshal.dump(header, f)
+                marshal.dump(code, f)
+            finally:
+                f.close()
+            os.rename(tmp, dir_cache_path(cache_dir, filename))
+        except:
+            os.unlink(tmp)
+            raise
+    except (IOError, OSError), e:
+        req.log_error("PSP could not cache the code of %s: %s"
+                      % (filename, e), apache.APLOG_WARNING)
+
+class HitsCache:
+    """
+    A least recently used cache of code objects, which holds at most
+    size of them and, unless max_bytes is 0, at most about max_bytes
+    of code (as marshalled). Keeps counts of its hits, misses and
+    evictions and of the time spent compiling what it was missing,
+    see stats().
+    """
+
+    def __init__(self, size=512, max_bytes=0):
         self.cache = {}
         self.size = size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compiles = 0
+        self.compile_time = 0.0
+        self._lock = Lock()
+
+        # entries are [previous, next, key, value, bytes] lists, linked
+        # in the access list from the least recently used onwards
+        self._head = [None, None, None, None, 0]
+        self._head[0] = self._head[1] = self._head
 
     def store(self, key, val):
-        self.cache[key] = (1, val)
-        if len(self.cache) > self.size:
-            self.clean()
+        self._store(key, val, val)
 
     def get(self, key):
-        if self.cache.has_key(key):
-            hits, val = self.cache[key]
-            self.cache[key] = (hits+1, val)
-            return val
-        else:
-            return None
+        self._lock.acquire()
+        try:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._access(entry)
+            self.hits += 1
+            return entry[3]
+        finally:
+            self._lock.release()
+
+    def compiled(self, seconds):
+        """ Count the compilation of something which was missing. """
+        self._lock.acquire()
+        try:
+            self.compiles += 1
+            self.compile_time += seconds
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """ Return a dictionary of the counters and the current size. """
+        self._lock.acquire()
+        try:
+            return {"entries": len(self.cache), "bytes": self.bytes,
+                    "size": self.size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "compiles": self.compiles,
+                    "compile_time": self.compile_time}
+        finally:
+            self._lock.release()
 
     def clean(self):
-        
-        byhits = [(n[1], n[0]) for n in self.cache.items()]
-        byhits.sort()
+        """ Evict least recently used entries until within the limits. """
+        self._lock.acquire()
+        try:
+            self._clean()
+        finally:
+            self._lock.release()
+
+    def set_limits(self, size=None, max_bytes=None):
+        """ Change the limits which are not None, evicting what no
+            longer fits right away. """
+        self._lock.acquire()
+        try:
+            if size is not None:
+                self.size = size
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._clean()
+        finally:
+            self._lock.release()
 
-        # delete enough least hit entries to make cache 75% full
-        for item in byhits[:len(self.cache)-int(self.size*.75)]:
-            val, key = item
-            del self.cache[key]
+    def _store(self, key, val, code):
+        self._lock.acquire()
+        try:
+            entry = self.cache.get(key)
+            if entry is not None:
+                if entry[3] == val:
+                    # stored again after a hit
+                    self._access(entry)
+                    return
+                self._remove(entry)
+            entry = [None, None, key, val, len(marshal.dumps(code))]
+            self.cache[key] = entry
+            self.bytes += entry[4]
+            self._access(entry)
+            self._clean()
+        finally:
+            self._lock.release()
+
+    def _access(self, entry):
+        """ Make entry the most recently used, under the lock. """
+        head = self._head
+        if entry[1] is not head:
+            if entry[0] is not None:
+                entry[0][1] = entry[1]
+                entry[1][0] = entry[0]
+            entry[0] = head[0]
+            entry[1] = head
+            head[0][1] = entry
+            head[0] = entry
+
+    def _remove(self, entry):
+        """ Remove entry, under the lock. """
+        entry[0][1] = entry[1]
+        entry[1][0] = entry[0]
+        del self.cache[entry[2]]
+        self.bytes -= entry[4]
+
+    def _clean(self):
+        head = self._head
+        while (len(self.cache) > self.size or
+               (self.max_bytes and self.bytes > self.max_bytes)) and self.cache:
+            self._remove(head[1])
+            self.evictions += 1
 
 mem_scache = HitsCache()
 
 class FileCache(HitsCache):
 
     def store(self, filename, mtime, code):
-        self.cache[filename] = (1, mtime, code)
-        if len(self.cache) > self.size:
-            self.clean()
+        self._store(filename, (mtime, code), code)
 
     def get(self, filename, mtime):
+        self._lock.acquire()
         try:
-            hits, c_mtime, code = self.cache[filename]
+            entry = self.cache.get(filename)
+            if entry is None:
+                self.misses += 1
+                return None
+            c_mtime, code = entry[3]
             if mtime != c_mtime:
-                del self.cache[filename]
+                self._remove(entry)
+                self.misses += 1
                 return None
-            else:
-                self.cache[filename] = (hits+1, mtime, code)
-                return code
-        except KeyError:
-            return None
+            self._access(entry)
+            self.hits += 1
+            return code
+        finally:
+            self._lock.release()
 
 mem_fcache = FileCache()
 
+# whether the limits of mem_fcache have been read from the options
+mem_fcache_limits_set = False
@@ -30,13 +30,23 @@
 
 import apache
 import util
+import watcher
 
 import sys
 import os
-from os.path import exists, isabs, normpath, split, isfile, join, dirname
+from os.path import isabs, normpath, split, isfile, join, dirname
 import imp
 import re
 import base64
+import time
+import marshal
+import tempfile
+
+try:
+    from hashlib import md5, sha1
+except ImportError:
+    from md5 import md5
+    from sha import sha as sha1
 
 import new
 import types
@@ -47,7 +57,7 @@ imp_suffixes = " ".join([x[0][1:] for x in imp.get_suffixes()])
 
 ####################### The published page cache ##############################
 
-from cache import ModuleCache, NOT_INITIALIZED
+from cache import ModuleCache, NOT_INITIALIZED, re_not_word
 
 class PageCache(ModuleCache):
     """ This is the cache for page objects. Handles the automatic reloading of pages. """
@@ -63,8 +73,18 @@ class PageCache(ModuleCache):
             # if we don't want to reload and we have a value,
             # then we consider it fresh
             return None
-        else:
-            return ModuleCache.check(self, key, req, entry)
+        if watcher.running() and entry._value is not NOT_INITIALIZED:
+            # no need to stat the page unless the watcher saw it change
+            if watcher.mtime(key) == entry._timestamp:
+                return None
+        elif entry._value is not NOT_INITIALIZED:
+            # no need to stat the page if it was checked less than
+            # mod_python.publisher.stat_interval seconds ago
+            interval = req.get_options().get("mod_python.publisher.stat_interval")
+            if interval and time.time() - entry._checked < float(interval):
+                return None
+        entry._checked = time.time()
+        return ModuleCache.check(self, key, req, entry)
 
     def build(self, key, req, opened, entry):
         config = req.get_config()
@@ -74,7 +94,68 @@ class PageCache(ModuleCache):
                 req.log_error('Publisher loading page %s'%req.filename, apache.APLOG_NOTICE)
             else:
                 req.log_error('Publisher reloading page %s'%req.filename, apache.APLOG_NOTICE)
-        return ModuleCache.build(self, key, req, opened, entry)
+        try:
+            code = self.load_code(key, req, opened)
+        finally:
+            opened.close()
+        module = new.module(re_not_word.sub('_',key))
+        module.__file__ = key
+        exec code in module.__dict__
+        return module
+
+    def load_code(self, key, req, opened):
+        """
+        Return the code object of the page in file opened. If the
+        mod_python.publisher.code_cache_dir PythonOption is set, the
+        code is kept there in marshal format, so that other processes
+        (and this one, after a restart) load it instead of compiling
+        the source again as long as the page does not change.
+        """
+
+        cache_dir = req.get_options().get("mod_python.publisher.code_cache_dir")
+        if not cache_dir:
+            return self.compile(key, opened)
+
+        st = os.fstat(opened.fileno())
+        header = (imp.get_magic(), key, st.st_mtime, st.st_size)
+        path = os.path.join(cache_dir, md5(key).hexdigest() + ".pyc")
+
+        try:
+            f = open(path, "rb")
+            try:
+                if marshal.load(f) == header:
+                    return marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            # no cached code or it is unreadable
+            pass
+
+        code = self.compile(key, opened)
+
+        # written to a temporary file which is then renamed, so that
+        # other processes never see a partly written file
+        try:
+            fd, tmp = tempfile.mkstemp(".tmp", "", cache_dir)
+            try:
+                f = os.fdopen(fd, "wb")
+                try:
+                    marshal.dump(header, f)
+                    marshal.dump(code, f)
+                finally:
+                    f.close()
+                os.rename(tmp, path)
+            except:
+                os.unlink(tmp)
+                raise
+        except (IOError, OSError), e:
+            req.log_error("Publisher could not cache the code of %s: %s"
+                          % (key, e), apache.APLOG_WARNING)
+
+        return code
+
+    def compile(self, key, opened):
+        return compile(opened.read().replace('\r\n', '\n'), key, 'exec', 0, 1)
 
 page_cache = PageCache()
 
@@ -107,11 +188,95 @@ page_cache = PageCache()
 
 ####################### The publisher handler himself ##########################    
 
-def handler(req):
+####################### The route cache ######################################
 
-    req.allow_methods(["GET", "POST", "HEAD"])
-    if req.method not in ["GET", "POST", "HEAD"]:
-        raise apache.SERVER_RETURN, apache.HTTP_METHOD_NOT_ALLOWED
+# what a route resolves to when the object is not in the page
+_MISSING = object()
+
+class Route:
+    """
+    How a request for a given filename and path_info (and handler
+    extensions) maps to a page file and to an object in it, as worked
+    out by resolve_route(). The files whose existence (or absence) the
+    route depends on are rechecked through the watcher when
+    PythonAutoReload is on. The object the first component of the
+    path names in the page module is kept together with its
+    authentication metadata, for as long as the module is not
+    reloaded and the name is bound to the same object. So is the
+    authentication metadata of the module itself.
+    """
+
+    def __init__(self, filename, func_path, exists, missing, status=None):
+        self.filename = filename
+        self.func_path = func_path
+        self.parts = func_path.split('.')
+        self.exists = exists
+        self.missing = missing
+        self.status = status
+        # (module, object, auth metadata, publishable)
+        self.resolved = None
+        # (module, auth metadata)
+        self.module_auth = None
+
+    def valid(self):
+        """ Whether the files are still there, or still missing. """
+        for path in self.exists:
+            if watcher.mtime(path) is None:
+                return False
+        for path in self.missing:
+            if watcher.mtime(path) is not None:
+                return False
+        return True
+
+    def authenticate(self, req, module):
+        """ Like process_auth(req, module). """
+
+        module_auth = self.module_auth
+        if module_auth is None or module_auth[0] is not module:
+            module_auth = (module, auth_metadata(module))
+            self.module_auth = module_auth
+
+        return check_auth(req, module_auth[1])
+
+    def resolve(self, req, module, realm, user, passwd):
+        """ Like resolve_object(req, module, self.func_path, ...). """
+
+        name = self.parts[0]
+        if len(self.parts) > 1 or name[0] == '_':
+            return resolve_object(req, module, self.func_path,
+                                  realm, user, passwd)
+
+        resolved = self.resolved
+        obj = module.__dict__.get(name, _MISSING)
+        if resolved is None or resolved[0] is not module or resolved[1] is not obj:
+            # first time, or the page was reloaded or changed
+            if obj is _MISSING:
+                resolved = (module, obj, None, False)
+            else:
+                rule = tp_rules.get(type(obj), default_tp_rule)
+                resolved = (module, obj, auth_metadata(obj), rule[1])
+            self.resolved = resolved
+
+        module, obj, metadata, publishable = resolved
+        if obj is _MISSING:
+            raise apache.SERVER_RETURN, apache.HTTP_NOT_FOUND
+
+        check_auth(req, metadata, realm, user, passwd)
+
+        if not publishable:
+            req.log_error('Cannot publish %s in %s because '
+                          '%s is not publishable'
+                          % (name, req.unparsed_uri, obj), apache.APLOG_WARNING)
+            raise apache.SERVER_RETURN, apache.HTTP_FORBIDDEN
+
+        return obj
+
+# routes by (filename, path_info, handler extensions, extension),
+# emptied when it holds more than route_cache_size of them
+route_cache = {}
+route_cache_size = 1000
+
+def resolve_route(req):
 
     # Derive the name of the actual module which will be
     # loaded. In older version of mod_python.publisher
@@ -171,19 +336,24 @@ def handler(req):
     # 'func_path' gets adjusted so the lead part is what
     # 'module_name' was set to.
 
-    req.filename = path + '/' + module_name + '.py'
+    filename = path + '/' + module_name + '.py'
+    missing = []
+
+    if watcher.mtime(filename) is None:
+        missing.append(filename)
 
-    if not exists(req.filename):
         if func_path:
             func_path = module_name + '/' + func_path
         else:
             func_path = module_name
 
         module_name = 'index' 
-        req.filename = path + '/' + module_name + '.py'
+        filename = path + '/' + module_name + '.py'
 
-        if not exists(req.filename):
-            raise apache.SERVER_RETURN, apache.HTTP_NOT_FOUND
+        if watcher.mtime(filename) is None:
+            missing.append(filename)
+            return Route(filename, func_path, [], missing,
+                         apache.HTTP_NOT_FOUND)
 
     # Default to looking for the 'index' function if no
     # function path definition was supplied.
@@ -197,17 +367,43 @@ def handler(req):
 
     # Normalise req.filename to avoid Win32 issues.
 
-    req.filename = normpath(req.filename)
+    return Route(normpath(filename), func_path, [filename], missing)
 
+####################### The publisher handler himself ##########################    
+
+def handler(req):
+
+    req.allow_methods(["GET", "POST", "HEAD"])
+    if req.method not in ["GET", "POST", "HEAD"]:
+        raise apache.SERVER_RETURN, apache.HTTP_METHOD_NOT_ALLOWED
+
+    # Find out which page and object the request is for, this
+    # is only done once for a given URL (and rechecked, unless
+    # PythonAutoReload is off)
+
+    key = (req.filename, req.path_info,
+           req.get_addhandler_exts(), req.extension)
+    route = route_cache.get(key)
+    if route is None or \
+           (int(req.get_config().get("PythonAutoReload", 1)) and not route.valid()):
+        route = resolve_route(req)
+        if len(route_cache) >= route_cache_size:
+            route_cache.clear()
+        route_cache[key] = route
+
+    if route.status:
+        raise apache.SERVER_RETURN, route.status
+
+    req.filename = route.filename
 
     # We use the page cache to load the module
     module = page_cache[req]
 
     # does it have an __auth__?
-    realm, user, passwd = process_auth(req, module)
+    realm, user, passwd = route.authenticate(req, module)
 
     # resolve the object ('traverse')
-    object = resolve_object(req, module, func_path, realm, user, passwd)
+    object = route.resolve(req, module, realm, user, passwd)
 
     # publish the object
     published = publish_object(req, object)
@@ -221,11 +417,21 @@ def handler(req):
     return apache.OK
 
 def process_auth(req, object, realm="unknown", user=None, passwd=None):
+    return check_auth(req, auth_metadata(object), realm, user, passwd)
+
+def auth_metadata(object):
+    """
+    Return the authentication metadata of object, a tuple of whether
+    it has an __auth_realm__, the realm, whether it has an __auth__,
+    the __auth__, whether it has an __access__ and the __access__.
+    """
 
-    found_auth, found_access = 0, 0
+    found_realm, found_auth, found_access = 0, 0, 0
+    realm = __auth__ = __access__ = None
 
     if hasattr(object, "__auth_realm__"):
         realm = object.__auth_realm__
+        found_realm = 1
 
     func_object = None
 
@@ -235,34 +441,20 @@ def process_auth(req, object, realm="unknown", user=None, passwd=None):
         func_object = object.im_func
 
     if func_object:
-        # functions are a bit tricky
-
-        func_code = func_object.func_code
-        func_globals = func_object.func_globals
-
-        def lookup(name):
-            i = None
-            if name in func_code.co_names:
-                i = list(func_code.co_names).index(name)
-            elif func_code.co_argcount < len(func_code.co_varnames):
-                names = func_code.co_varnames[func_code.co_argcount:]
-                if name in names:
-                    i = list(names).index(name)
-            if i is not None:
-                return (1, func_code.co_consts[i+1])
-            return (0, None)
-
-        (found_auth, __auth__) = lookup('__auth__')
-        if found_auth and type(__auth__) == types.CodeType:
-            __auth__ = new.function(__auth__, func_globals)
-
-        (found_access, __access__) = lookup('__access__')
-        if found_access and type(__access__) == types.CodeType:
-            __access__ = new.function(__access__, func_globals)
-
-        (found_realm, __auth_realm__) = lookup('__auth_realm__')
-        if found_realm:
+        # functions are a bit tricky, what they contain is only
+        # looked for once for a given function and code
+        cached = func_auth.get(func_object)
+        if cached is None or cached[0] is not func_object.func_code:
+            cached = (func_object.func_code, func_auth_metadata(func_object))
+            if len(func_auth) >= func_auth_size:
+                func_auth.clear()
+            func_auth[func_object] = cached
+
+        (found, __auth_realm__,
+         found_auth, __auth__, found_access, __access__) = cached[1]
+        if found:
             realm = __auth_realm__
+            found_realm = 1
 
     else:
         if hasattr(object, "__auth__"):
@@ -272,6 +464,58 @@ def process_auth(req, object, realm="unknown", user=None, passwd=None):
             __access__ = object.__access__
             found_access = 1
 
+    return found_realm, realm, found_auth, __auth__, found_access, __access__
+
+# the authentication metadata of functions by function, along with
+# the code it was found in, emptied when it holds more than
+# func_auth_size of them
+func_auth = {}
+func_auth_size = 1000
+
+def func_auth_metadata(func_object):
+    """
+    Return the authentication metadata found in the code of a
+    function, in the same form as auth_metadata().
+    """
+
+    func_code = func_object.func_code
+    func_globals = func_object.func_globals
+
+    def lookup(name):
+        i = None
+        if name in func_code.co_names:
+            i = list(func_code.co_names).index(name)
+        elif func_code.co_argcount < len(func_code.co_varnames):
+            names = func_code.co_varnames[func_code.co_argcount:]
+            if name in names:
+                i = list(names).index(name)
+        if i is not None:
+            return (1, func_code.co_consts[i+1])
+        return (0, None)
+
+    (found_auth, __auth__) = lookup('__auth__')
+    if found_auth and type(__auth__) == types.CodeType:
+        __auth__ = new.function(__auth__, func_globals)
+
+    (found_access, __access__) = lookup('__access__')
+    if found_access and type(__access__) == types.CodeType:
+        __access__ = new.function(__access__, func_globals)
+
+    (found_realm, realm) = lookup('__auth_realm__')
+
+    return found_realm, realm, found_auth, __auth__, found_access, __access__
+
+def check_auth(req, metadata, realm="unknown", user=None, passwd=None):
+    """
+    Authenticate and authorize the request against the metadata
+    returned by auth_metadata(), return the realm, user and password.
+    """
+
+    (found_realm, object_realm,
+     found_auth, __auth__, found_access, __access__) = metadata
+    if found_realm:
+        realm = object_realm
+
     if found_auth or found_access:
         # because ap_get_basic insists on making sure that AuthName and
         # AuthType directives are specified and refuses to do anything
@@ -297,7 +541,11 @@ def process_auth(req, object, realm="unknown", user=None, passwd=None):
             raise apache.SERVER_RETURN, apache.HTTP_UNAUTHORIZED
 
         if callable(__auth__):
-            rc = __auth__(req, user, passwd)
+            ttl = float(req.get_options().get("mod_python.publisher.auth_cache_ttl", 0))
+            if ttl > 0:
+                rc = cached_auth(req, __auth__, realm, user, passwd, ttl)
+            else:
+                rc = __auth__(req, user, passwd)
         else:
             if type(__auth__) is DictionaryType:
                 rc = __auth__.has_key(user) and __auth__[user] == passwd
@@ -324,6 +572,35 @@ def process_auth(req, object, realm="unknown", user=None, passwd=None):
 
     return realm, user, passwd
 
+# when successful authentications expire, by __auth__, realm, user
+# and password hash, emptied when it holds more than auth_cache_size
+# of them
+auth_cache = {}
+auth_cache_size = 1000
+
+def cached_auth(req, __auth__, realm, user, passwd, ttl):
+    """
+    Call __auth__(req, user, passwd), unless it already succeeded for
+    the same realm, user and password less than ttl seconds ago.
+    Failures are never remembered.
+    """
+
+    key = (__auth__, realm, user, sha1(passwd).hexdigest())
+    now = time.time()
+    try:
+        if auth_cache.get(key, 0) > now:
+            return True
+    except TypeError:
+        # __auth__ is not hashable
+        return __auth__(req, user, passwd)
+
+    rc = __auth__(req, user, passwd)
+    if rc:
+        if len(auth_cache) >= auth_cache_size:
+            auth_cache.clear()
+        auth_cache[key] = now + ttl
+    return rc
+
 ### Those are the traversal and publishing rules ###
 
 # tp_rules is a dictionary, indexed by type, with tuple values.
@@ -413,6 +690,9 @@ def resolve_object(req, obj, object_str, realm=None, user=None, passwd=None):
 # This regular expression is used to test for the presence of an HTML header
 # tag, written in upper or lower case.
 re_html = re.compile(r"</HTML\s*>\s*$",re.I)
+# and this one for the beginning of an HTML document, which is what
+# published iterables are looked at, since their end is not known yet
+re_html_start = re.compile(r"^\s*<(!DOCTYPE\s+)?HTML",re.I)
 re_charset = re.compile(r"charset\s*=\s*([^\s;]+)",re.I);
 
 def publish_object(req, object):
@@ -421,50 +701,26 @@ def publish_object(req, object):
         # To publish callables, we call them an recursively publish the result
         # of the call (as done by util.apply_fs_data)
         
-        req.form = util.FieldStorage(req, keep_blank_values=1)
+        req.form = util.FieldStorage(req, keep_blank_values=1,
+                                     lazy=util.lazy_form(req))
         return publish_object(req,util.apply_fs_data(object, req.form, req=req))
 
-# TODO : we removed this as of mod_python 3.2, let's see if we can put it back
-# in mod_python 3.3    
-#     elif hasattr(object,'__iter__'):
-#     
-#         # To publish iterables, we recursively publish each item
-#         # This way, generators can be published
-#         result = False
-#         for item in object:
-#             result |= publish_object(req,item)
-#         return result
-#         
+    elif hasattr(object,'next') and hasattr(object,'__iter__'):
+
+        # To publish iterators, we publish each item as it comes
+        # This way, generators can stream their output. Other
+        # iterables (lists, dicts...) are published as strings.
+        flush_size = int(req.get_options().get("mod_python.publisher.flush_size", 0))
+        return publish_iterable(req, object, flush_size)
+
     else:
         if object is None:
             
             # Nothing to publish
             return False
-            
-        elif isinstance(object,UnicodeType):
-            
-            # We've got an Unicode string to publish, so we have to encode
-            # it to bytes. We try to detect the character encoding
-            # from the Content-Type header
-            if req._content_type_set:
-
-                charset = re_charset.search(req.content_type)
-                if charset:
-                    charset = charset.group(1)
-                else:
-                    # If no character encoding was set, we use UTF8
-                    charset = 'UTF8'
-                    req.content_type += '; charset=UTF8'
 
-            else:
-                # If no character encoding was set, we use UTF8
-                charset = 'UTF8'
-                
-            result = object.encode(charset)
-        else:
-            charset = None
-            result = str(object)
-            
+        result, charset = encode_object(req, object)
+
         if not req._content_type_set:
             # make an attempt to guess content-type
             # we look for a </HTML in the last 100 characters.
@@ -488,3 +744,81 @@ def publish_object(req, object):
         req.write(result, 0)
 
         return True
+
+def publish_iterable(req, iterable, flush_size=0, pending=None):
+    """
+    Publish the items of iterable one by one, items which are
+    themselves iterators are published the same way. Unless
+    flush_size is 0, the output is flushed whenever at least
+    flush_size bytes have been written since the last flush.
+    """
+
+    published = False
+    if pending is None:
+        # bytes written since the last flush, counted
+        # across the nested iterators too
+        pending = [0]
+
+    for item in iterable:
+
+        if item is None:
+            continue
+
+        if hasattr(item,'next') and hasattr(item,'__iter__'):
+            if publish_iterable(req, item, flush_size, pending):
+                published = True
+            continue
+
+        result, charset = encode_object(req, item)
+        if not result:
+            continue
+
+        if not req._content_type_set:
+            # the content-type is guessed from the first item
+            if re_html_start.search(result) or \
+                   re_html.search(result,len(result)-100):
+                req.content_type = 'text/html'
+            else:
+                req.content_type = 'text/plain'
+            if charset is not None:
+                req.content_type += '; charset=%s'%charset
+
+        req.write(result, 0)
+        published = True
+
+        if flush_size:
+            pending[0] += len(result)
+            if pending[0] >= flush_size:
+                req.flush()
+                pending[0] = 0
+
+    return published
+
+def encode_object(req, object):
+    """
+    Return the string to publish for object, along with the
+    character encoding used if it was a Unicode string.
+    """
+
+    if isinstance(object,UnicodeType):
+
+        # We've got an Unicode string to publish, so we have to encode
+        # it to bytes. We try to detect the character encoding
+        # from the Content-Type header
+        if req._content_type_set:
+
+            charset = re_charset.search(req.content_type)
+            if charset:
+                charset = charset.group(1)
+            else:
+                # If no character encoding was set, we use UTF8
+                charset = 'UTF8'
+                req.content_type += '; charset=UTF8'
+
+        else:
+            # If no character encoding was set, we use UTF8
+            charset = 'UTF8'
+
+        return object.encode(charset), charset
+
+    return str(object), None
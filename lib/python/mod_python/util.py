@@ -23,6 +23,7 @@ import apache
 import cStringIO
 import tempfile
 import re
+import weakref
 
 from types import *
 from exceptions import *
@@ -34,6 +35,11 @@ parse_qsl = _apache.parse_qsl
 # Fixes memory error when upload large files such as 700+MB ISOs.
 readBlockSize = 65368
 
+# Parts of a multipart form uploaded as files are kept in memory up
+# to this size (PythonOption mod_python.form.spool_threshold), then
+# spooled to a temporary file.
+spoolThreshold = 65536
+
 """ The classes below are a (almost) a drop-in replacement for the
     standard cgi.py FieldStorage class. They should have pretty much the
     same functionality.
@@ -129,102 +135,306 @@ class StringField(str):
         """Return printable representation (to pass unit tests)."""
         return "Field(%s, %s)" % (`self.name`, `self.value`)
 
+class SpooledFile:
+    """ A file kept in a cStringIO until more than max_size bytes are
+    written to it, at which point its contents move to a temporary file
+    in directory dir (rollover). Any other attribute is that of the
+    underlying file, and asking for the file descriptor rolls the file
+    over.
+    """
+
+    def __init__(self, max_size, dir=None):
+        self._file = cStringIO.StringIO()
+        self._max_size = max_size
+        self._dir = dir
+        self._rolled = False
+
+    def rollover(self):
+        if not self._rolled:
+            file = tempfile.TemporaryFile("w+b", dir=self._dir)
+            file.write(self._file.getvalue())
+            file.seek(self._file.tell())
+            self._file = file
+            self._rolled = True
+
+    def rolled(self):
+        """ True if the contents are in a temporary file. """
+        return self._rolled
+
+    def write(self, s):
+        if not self._rolled and self._file.tell() + len(s) > self._max_size:
+            self.rollover()
+        self._file.write(s)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def fileno(self):
+        self.rollover()
+        return self._file.fileno()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class _BoundedStringIO(SpooledFile):
+    """ A form field value which may not take more than
+    max_size bytes of memory. """
+
+    def rollover(self):
+        raise apache.SERVER_RETURN, apache.HTTP_REQUEST_ENTITY_TOO_LARGE
+
 class FieldList(list):
+    """ The list of fields of a form, with an index of the fields by
+    name (see table()) which is kept up to date as fields are added
+    and removed, rather than rebuilt. Operations on slices drop the
+    index, it is then rebuilt by the next table() call.
+    """
+
+    __slots__ = ("__table",)
 
     def __init__(self):
-        self.__table = None
+        self.__table = {}
         list.__init__(self)
 
     def table(self):
+        """ Return a dictionary of the lists of fields by name. """
         if self.__table is None:
             self.__table = {}
             for item in self:
-                if item.name in self.__table:
-                    self.__table[item.name].append(item)
-                else:
-                    self.__table[item.name] = [item]
+                self.__index(item)
         return self.__table
 
-    def __delitem__(self, *args):
-        self.__table = None
-        return list.__delitem__(self, *args)
+    def __index(self, item):
+        table = self.__table
+        if table is not None:
+            name = item.name
+            if name in table:
+                table[name].append(item)
+            else:
+                table[name] = [item]
+
+    def __unindex(self, item):
+        table = self.__table
+        if table is not None:
+            items = table[item.name]
+            for i in xrange(len(items)):
+                if items[i] is item:
+                    del items[i]
+                    break
+            if not items:
+                del table[item.name]
+
+    def __reindex(self, name):
+        # the fields named name, in the order of the list
+        table = self.__table
+        if table is not None:
+            items = [item for item in self if item.name == name]
+            if items:
+                table[name] = items
+            else:
+                table.pop(name, None)
+
+    def delete(self, name):
+        """ Remove all fields named name. """
+        list.__setslice__(self, 0, len(self),
+                          [item for item in self if item.name != name])
+        if self.__table is not None:
+            self.__table.pop(name, None)
+
+    def __delitem__(self, i):
+        if type(i) is SliceType:
+            self.__table = None
+            return list.__delitem__(self, i)
+        item = self[i]
+        list.__delitem__(self, i)
+        self.__unindex(item)
 
     def __delslice__(self, *args):
         self.__table = None
         return list.__delslice__(self, *args)
 
-    def __iadd__(self, *args):
-        self.__table = None
-        return list.__iadd__(self, *args)
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
 
     def __imul__(self, *args):
         self.__table = None
         return list.__imul__(self, *args)
 
-    def __setitem__(self, *args):
-        self.__table = None
-        return list.__setitem__(self, *args)
+    def __setitem__(self, i, item):
+        if type(i) is SliceType:
+            self.__table = None
+            return list.__setitem__(self, i, item)
+        old = self[i]
+        list.__setitem__(self, i, item)
+        self.__reindex(old.name)
+        if item.name != old.name:
+            self.__reindex(item.name)
 
     def __setslice__(self, *args):
         self.__table = None
         return list.__setslice__(self, *args)
 
-    def append(self, *args):
-        self.__table = None
-        return list.append(self, *args)
+    def append(self, item):
+        list.append(self, item)
+        self.__index(item)
 
-    def extend(self, *args):
-        self.__table = None
-        return list.extend(self, *args)
+    def extend(self, items):
+        for item in items:
+            self.append(item)
 
-    def insert(self, *args):
-        self.__table = None
-        return list.insert(self, *args)
+    def insert(self, i, item):
+        list.insert(self, i, item)
+        if self[-1] is item:
+            self.__index(item)
+        else:
+            self.__reindex(item.name)
 
     def pop(self, *args):
+        item = list.pop(self, *args)
+        self.__unindex(item)
+        return item
+
+    def remove(self, item):
+        del self[self.index(item)]
+
+    def reverse(self):
         self.__table = None
-        return list.pop(self, *args)
+        return list.reverse(self)
 
-    def remove(self, *args):
+    def sort(self, *args, **kwargs):
         self.__table = None
-        return list.remove(self, *args)
+        return list.sort(self, *args, **kwargs)
 
 
 class FieldStorage:
 
-    def __init__(self, req, keep_blank_values=0, strict_parsing=0, file_callback=None, field_callback=None):
+    # multipart boundary, as a string and as a line matching regex
+    _boundary = _boundary_re = None
+
+    def __init__(self, req, keep_blank_values=0, strict_parsing=0, file_callback=None, field_callback=None, lazy=0):
         #
         # Whenever readline is called ALWAYS use the max size EVEN when
         # not expecting a long line. - this helps protect against
         # malformed content from exhausting memory.
         #
 
-        self.list = FieldList()
+        # fields parsed so far, this becomes self.list once the
+        # whole form has been parsed (see __getattr__)
+        self._list = FieldList()
 
-        # always process GET-style parameters
-        if req.args:
-            pairs = parse_qsl(req.args, keep_blank_values)
-            for pair in pairs:
-                self.add_field(pair[0], pair[1])
+        self._req = req
+        self._keep_blank_values = keep_blank_values
+        self._file_callback = file_callback
+        self._field_callback = field_callback
 
-        if req.method != "POST":
-            return
+        # the query string is parsed on first access, the body one
+        # field at a time by the _parse_body() generator
+        self._args_parsed = False
+        self._body = None
+        if req.method == "POST":
+            self._body = self._parse_body()
+
+        if not lazy:
+            self._parse_all()
+
+    def __getattr__(self, name):
+        if name != "list":
+            raise AttributeError, name
+        # the list of all the fields, parse what is left of the form
+        self._parse_all()
+        return self.list
+
+    def _parse_args(self):
+        # always process GET-style parameters
+        if not self._args_parsed:
+            self._args_parsed = True
+            if self._req.args:
+                pairs = parse_qsl(self._req.args, self._keep_blank_values)
+                for pair in pairs:
+                    self.add_field(pair[0], pair[1])
+
+    def _next_body_field(self):
+        """ Parse the next field of the body into the list and return
+            it, or return None if the whole form has been parsed. """
+
+        self._parse_args()
+        if self._body is not None:
+            try:
+                return self._body.next()
+            except StopIteration:
+                self._body = None
+            except:
+                self._body = None
+                raise
+        self.list = self._list
+        return None
+
+    def _parse_all(self):
+        while self._next_body_field() is not None:
+            pass
+
+    def read_body(self):
+        """ Parse all of the form, including the request body. """
+        self._parse_all()
+
+    def _parse_body(self):
+        """ Generator parsing the request body, adding the fields to
+            the list and yielding them one by one. """
+
+        req = self._req
 
         try:
             clen = int(req.headers_in["content-length"])
         except (KeyError, ValueError):
-            # absent content-length is not acceptable
-            raise apache.SERVER_RETURN, apache.HTTP_LENGTH_REQUIRED
+            # absent content-length is not acceptable, unless the
+            # body is chunked, in which case req.read() will raise
+            # HTTP_LENGTH_REQUIRED if chunked bodies are not enabled
+            # with PythonOption mod_python.request_body.chunked
+            if not req.headers_in.has_key("transfer-encoding") or \
+                   req.headers_in["transfer-encoding"].strip().lower() != "chunked":
+                raise apache.SERVER_RETURN, apache.HTTP_LENGTH_REQUIRED
+            clen = -1
 
         if not req.headers_in.has_key("content-type"):
             ctype = "application/x-www-form-urlencoded"
         else:
             ctype = req.headers_in["content-type"]
 
+        # memory to keep parts in, see SpooledFile
+        options = req.get_options()
+        threshold = int(options.get("mod_python.form.spool_threshold",
+                                    spoolThreshold))
+        spool_dir = options.get("mod_python.form.spool_dir")
+        if "mod_python.form.memory_limit" in options:
+            budget = int(options["mod_python.form.memory_limit"])
+        else:
+            budget = None
+
         if ctype.startswith("application/x-www-form-urlencoded"):
-            pairs = parse_qsl(req.read(clen), keep_blank_values)
-            for pair in pairs:
-                self.add_field(pair[0], pair[1])
+            if budget is not None and clen > budget:
+                raise apache.SERVER_RETURN, apache.HTTP_REQUEST_ENTITY_TOO_LARGE
+            max_fields = int(options.get("mod_python.form.max_fields", -1))
+            max_size = int(options.get("mod_python.form.max_field_size", -1))
+            if type(req) is _apache.request:
+                # read the body one field at a time
+                pairs = self._read_qsl(req, max_size)
+            else:
+                pairs = parse_qsl(req.read(clen), self._keep_blank_values)
+            count = 0
+            for key, value in pairs:
+                count += 1
+                if count == max_fields + 1:
+                    raise apache.SERVER_RETURN, apache.HTTP_REQUEST_ENTITY_TOO_LARGE
+                if budget is not None:
+                    budget -= len(key) + len(value)
+                    if budget < 0:
+                        raise apache.SERVER_RETURN, apache.HTTP_REQUEST_ENTITY_TOO_LARGE
+                yield self.add_field(key, value)
             return
 
         if not ctype.startswith("multipart/"):
@@ -237,11 +447,16 @@ class FieldStorage:
             boundary = ctype[i+9:]
             if len(boundary) >= 2 and boundary[0] == boundary[-1] == '"':
                 boundary = boundary[1:-1]
+            self._boundary = boundary
             boundary = re.compile("--" + re.escape(boundary) + "(--)?\r?\n") 
+            self._boundary_re = boundary
 
         except ValueError:
             raise apache.SERVER_RETURN, apache.HTTP_BAD_REQUEST
 
+        file_callback = self._file_callback
+        field_callback = self._field_callback
+
         # read until boundary
         self.read_to_boundary(req, boundary, None)
 
@@ -314,16 +529,24 @@ class FieldStorage:
             if disp_options.has_key("filename"):
                 if file_callback and callable(file_callback):
                     file = file_callback(disp_options["filename"])
+                elif budget is None:
+                    file = SpooledFile(threshold, spool_dir)
                 else:
-                    file = tempfile.TemporaryFile("w+b")
+                    file = SpooledFile(min(threshold, budget), spool_dir)
             else:
                 if field_callback and callable(field_callback):
                     file = field_callback()
-                else:
+                elif budget is None:
                     file = cStringIO.StringIO()
+                else:
+                    file = _BoundedStringIO(budget)
 
             # read it in
             self.read_to_boundary(req, boundary, file)
+            if budget is not None and isinstance(file, SpooledFile) \
+                   and not file.rolled():
+                # what is kept in memory counts against the budget
+                budget -= file.tell()
             file.seek(0)
  
             # make a Field
@@ -339,25 +562,44 @@ class FieldStorage:
             field.disposition = disp
             field.disposition_options = disp_options
             field.headers = headers
-            self.list.append(field)
+            self._list.append(field)
+            yield field
+
+    def _read_qsl(self, req, max_size):
+        while True:
+            try:
+                pair = _apache.read_qsl_field(req, self._keep_blank_values,
+                                              max_size)
+            except ValueError:
+                # the field is longer than max_size
+                raise apache.SERVER_RETURN, apache.HTTP_REQUEST_ENTITY_TOO_LARGE
+            if pair is None:
+                return
+            yield pair
 
     def add_field(self, key, value):
         """Insert a field as key/value pair"""
         item = StringField(value)
         item.name = key
-        self.list.append(item)
+        self._list.append(item)
+        return item
 
     def __setitem__(self, key, value):
-        table = self.list.table()
-        if table.has_key(key):
-            items = table[key]
-            for item in items:
-                self.list.remove(item)
+        self.list.delete(key)
         item = StringField(value)
         item.name = key
         self.list.append(item)
 
     def read_to_boundary(self, req, boundary, file):
+        if (type(req) is _apache.request and boundary is self._boundary_re
+            and 0 < len(self._boundary) <= 200):
+            # search the request read buffer for the boundary in C,
+            # which does not take empty or overly long boundaries
+            return _apache.read_to_boundary(req, self._boundary, file)
+        return self._read_to_boundary(req, boundary, file)
+
+    def _read_to_boundary(self, req, boundary, file):
+        # the same, one line at a time
         previous_delimiter = None
         while True:
             line = req.readline(readBlockSize)
@@ -406,13 +648,37 @@ class FieldStorage:
                     file.write(line)
                 previous_delimiter = None
 
+    def _find(self, key, first=False):
+        """ Return the list of fields named key, parsing no more of
+            the form than needed. The body is only parsed if the key
+            is not in the query string, and only up to the first field
+            with that name if first is true. """
+
+        if "list" in self.__dict__:
+            # the whole form has been parsed
+            return self.list.table().get(key, [])
+
+        self._parse_args()
+        found = self._list.table().get(key)
+        if found:
+            return found
+
+        while True:
+            field = self._next_body_field()
+            if field is None or (first and field.name == key):
+                break
+        return self._list.table().get(key, [])
+
     def __getitem__(self, key):
         """Dictionary style indexing."""
-        found = self.list.table()[key]
+        found = self._find(key)
+        if not found:
+            raise KeyError, key
         if len(found) == 1:
             return found[0]
         else:
-            return found
+            # a copy, the index is updated in place
+            return list(found)
 
     def get(self, key, default):
         try:
@@ -432,7 +698,7 @@ class FieldStorage:
 
     def has_key(self, key):
         """Dictionary style has_key() method."""
-        return (key in self.list.table())
+        return len(self._find(key, first=True)) > 0
 
     __contains__ = has_key
 
@@ -442,17 +708,14 @@ class FieldStorage:
 
     def getfirst(self, key, default=None):
         """ return the first value received """
-        try:
-            return self.list.table()[key][0]
-        except KeyError:
-            return default
+        found = self._find(key, first=True)
+        if found:
+            return found[0]
+        return default
 
     def getlist(self, key):
         """ return a list of received values """
-        try:
-            return self.list.table()[key]
-        except KeyError:
-            return []
+        return list(self._find(key))
            
     def items(self):
         """Dictionary-style items(), except that items are returned in the same
@@ -460,13 +723,22 @@ class FieldStorage:
         return [(item.name, item) for item in self.list]
 
     def __delitem__(self, key):
-        table = self.list.table()
-        values = table[key]
-        for value in values:
-            self.list.remove(value)
+        if key not in self.list.table():
+            raise KeyError, key
+        self.list.delete(key)
 
     def clear(self):
-        self.list = FieldList()
+        self.list = self._list = FieldList()
+        self._body = None
+
+def lazy_form(req):
+    """
+    True if the publisher and PSP are to create their FieldStorage in
+    lazy mode, which is set with PythonOption mod_python.form.lazy.
+    """
+
+    lazy = req.get_options().get("mod_python.form.lazy", "0")
+    return lazy.lower() in ("1", "on", "yes", "true")
 
 
 def parse_header(line):
@@ -490,6 +762,31 @@ def parse_header(line):
             pdict[name] = value
     return key, pdict
 
+# binding plans of the functions apply_fs_data() has called
+_fs_plans = weakref.WeakKeyDictionary()
+
+def _fs_plan(func, skip):
+    """
+    Return the binding plan of function func: its code object, the
+    names of the arguments it accepts (skipping the first skip ones,
+    i.e. self), the same as a dictionary and whether it accepts
+    **kw. Plans are computed once per function.
+    """
+
+    fc = func.func_code
+    try:
+        plan = _fs_plans.get(func)
+    except TypeError:
+        # not weakly referenceable, do not cache
+        plan = None
+        func = None
+    if plan is None or plan[0] is not fc:
+        expected = fc.co_varnames[skip:fc.co_argcount]
+        plan = (fc, expected, dict.fromkeys(expected), fc.co_flags & 0x08)
+        if func is not None:
+            _fs_plans[func] = plan
+    return plan
+
 def apply_fs_data(object, fs, **args):
     """
     Apply FieldStorage data to an object - the object must be
@@ -501,40 +798,44 @@ def apply_fs_data(object, fs, **args):
     # and for that we need to get a list of them. There
     # are a few options for callable objects here:
 
-    fc = None
-    expected = []
+    func = None
     if hasattr(object, "func_code"):
         # function
-        fc = object.func_code
-        expected = fc.co_varnames[0:fc.co_argcount]
+        func, skip = object, 0
     elif hasattr(object, 'im_func'):
         # method
-        fc = object.im_func.func_code
-        expected = fc.co_varnames[1:fc.co_argcount]
+        func, skip = object.im_func, 1
     elif type(object) in (TypeType,ClassType):
         # class
-        fc = object.__init__.im_func.func_code
-        expected = fc.co_varnames[1:fc.co_argcount]
+        func, skip = object.__init__.im_func, 1
     elif type(object) is BuiltinFunctionType:
         # builtin
-        fc = None
-        expected = []
+        func = None
     elif hasattr(object, '__call__'):
         # callable object
         if type(object.__call__) is MethodType:
-            fc = object.__call__.im_func.func_code
-            expected = fc.co_varnames[1:fc.co_argcount]
+            func, skip = object.__call__.im_func, 1
         else:
             # abuse of objects to create hierarchy
             return apply_fs_data(object.__call__, fs, **args)
 
-    # add form data to args
-    for field in fs.list:
-        if field.filename:
-            val = field
-        else:
-            val = field.value
-        args.setdefault(field.name, []).append(val)
+    if func is None:
+        return object()
+
+    fc, expected, accepted, takes_kw = _fs_plan(func, skip)
+
+    if takes_kw or not isinstance(fs, FieldStorage):
+        # add form data to args, the arguments given
+        # explicitly (i.e. req) take precedence
+        explicit = args.copy()
+        for field in fs.list:
+            if field.name in explicit:
+                continue
+            if field.filename:
+                val = field
+            else:
+                val = field.value
+            args.setdefault(field.name, []).append(val)
 
     # replace lists with single values
     for arg in args:
@@ -544,13 +845,28 @@ def apply_fs_data(object, fs, **args):
 
     # remove unexpected args unless co_flags & 0x08,
     # meaning function accepts **kw syntax
-    if fc is None:
-        args = {}
-    elif not (fc.co_flags & 0x08):
+    if not takes_kw:
         for name in args.keys():
-            if name not in expected:
+            if name not in accepted:
                 del args[name]
 
+        if isinstance(fs, FieldStorage):
+            # only the expected names are looked up in the
+            # form, which a lazy FieldStorage parses no more
+            # than it has to for that
+            for name in expected:
+                if name not in args:
+                    values = []
+                    for field in fs.getlist(name):
+                        if field.filename:
+                            values.append(field)
+                        else:
+                            values.append(field.value)
+                    if len(values) == 1:
+                        args[name] = values[0]
+                    elif values:
+                        args[name] = values
+
     return object(**args)
 
 def redirect(req, location, permanent=0, text=None):
@@ -0,0 +1,363 @@
+ # vim: set sw=4 expandtab :
+ #
+ # Copyright (C) 2000, 2001, 2013 Gregory Trubetskoy
+ # Copyright (C) 2002, 2003, 2004, 2005, 2006, 2007 Apache Software Foundation
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License"); you
+ # may not use this file except in compliance with the License.  You
+ # may obtain a copy of the License at
+ #
+ #      http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+ # implied.  See the License for the specific language governing
+ # permissions and limitations under the License.
+ #
+ # Originally developed by Gregory Trubetskoy.
+ #
+
+"""
+  Background watcher for source file changes.
+
+  When started (see the mod_python.watcher.interval PythonOption), a
+  thread keeps track of the files whose modification time has been
+  asked for through mtime() and adds those that change to a dirty
+  set, using inotify where available and periodic polling otherwise.
+  mtime() then only stats files that are in the dirty set or have
+  not been seen before, so request threads do not stat unchanged
+  source files.
+
+  Since the paths asked for may come from URLs, at most max_files
+  existing files are tracked and at most max_missing paths that do
+  not exist are remembered as such; other paths are simply stat'ed.
+
+  Without a running watcher mtime() simply stats the file.
+"""
+
+import os
+import sys
+import time
+import select
+import struct
+
+try:
+    import threading
+except:
+    import dummy_threading as threading
+
+# inotify is used through ctypes if possible
+_libc = None
+if sys.platform.startswith("linux"):
+    try:
+        import ctypes
+        _libc = ctypes.CDLL("libc.so.6", use_errno=True)
+        _libc.inotify_init
+        _libc.inotify_add_watch
+    except:
+        _libc = None
+
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+
+_IN_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+_EVENT_HDR = "iIII"
+_EVENT_HDR_SIZE = struct.calcsize(_EVENT_HDR)
+
+# what mtime() records for a file that does not exist
+_MISSING = None
+
+class FileWatcher:
+    """
+    Keeps the modification times of watched files and the set of
+    those that may have changed since they were last looked at.
+    """
+
+    def __init__(self, interval=1.0, use_inotify=True,
+                 max_files=10000, max_missing=256):
+
+        self.interval = interval
+        self.use_inotify = use_inotify and _libc is not None
+        self.max_files = max_files
+        self.max_missing = max_missing
+
+        self._lock = threading.Lock()
+        self._mtimes = {}     # path -> last known mtime, existing files
+        self._missing = {}    # path -> None, paths known not to exist
+        self._dirty = {}      # path -> None, paths to stat again
+        self._polled = {}     # path -> None, paths not covered by inotify
+        self._dirs = {}       # directory -> inotify watch descriptor
+        self._wds = {}        # inotify watch descriptor -> directory
+
+        self._fd = None
+        self._thread = None
+        self._pid = None
+        self._stop = False
+
+    def start(self):
+        """ Start the watcher thread in this process. """
+
+        self._lock.acquire()
+        try:
+            if self._pid == os.getpid():
+                return
+
+            # after a fork the thread and the inotify
+            # descriptor are gone, start from scratch
+            self._mtimes.clear()
+            self._missing.clear()
+            self._dirty.clear()
+            self._polled.clear()
+            self._dirs.clear()
+            self._wds.clear()
+
+            if self._fd is not None:
+                try: os.close(self._fd)
+                except OSError: pass
+            self._fd = None
+            if self.use_inotify:
+                fd = _libc.inotify_init()
+                if fd >= 0:
+                    self._fd = fd
+
+            self._pid = os.getpid()
+            self._stop = False
+            self._thread = threading.Thread(target=self._run,
+                                            name="mod_python watcher")
+            self._thread.setDaemon(True)
+            self._thread.start()
+        finally:
+            self._lock.release()
+
+    def stop(self):
+        """ Stop the watcher thread. """
+
+        self._stop = True
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(self.interval * 2)
+        self._thread = None
+        self._pid = None
+        if self._fd is not None:
+            try: os.close(self._fd)
+            except OSError: pass
+            self._fd = None
+
+    def running(self):
+        """ True if the watcher thread runs in this process. """
+        return self._pid == os.getpid()
+
+    def mtime(self, path):
+        """
+        Return the modification time of path, or None if it does
+        not exist. The file is only stat'ed if it has not been seen
+        before or may have changed since.
+        """
+
+        if path not in self._dirty:
+            try:
+                return self._mtimes[path]
+            except KeyError:
+                if path in self._missing:
+                    return _MISSING
+
+        self._lock.acquire()
+        try:
+            # forget the dirty flag before stat'ing, so that
+            # a change after this point is not lost
+            self._dirty.pop(path, None)
+            mtime = _stat_mtime(path)
+            self._track(path, mtime)
+            return mtime
+        finally:
+            self._lock.release()
+
+    def _track(self, path, mtime):
+        """
+        Remember the mtime just stat'ed for path, within the limits
+        on the number of paths. Called with the lock held.
+        """
+
+        if mtime is _MISSING:
+            self._mtimes.pop(path, None)
+            if path not in self._missing:
+                if len(self._missing) >= self.max_missing:
+                    self._forget(self._missing.popitem()[0])
+                self._missing[path] = None
+                # no new inotify watch for a path which may well be
+                # made up, the directory may not even exist
+                self._watch(path, new_dir=False)
+        else:
+            if path not in self._mtimes:
+                self._missing.pop(path, None)
+                if len(self._mtimes) >= self.max_files:
+                    # not tracked, stat'ed every time
+                    self._forget(path)
+                    return
+                self._watch(path)
+            self._mtimes[path] = mtime
+
+    def _forget(self, path):
+        """ Stop tracking path. Called with the lock held. """
+
+        self._mtimes.pop(path, None)
+        self._missing.pop(path, None)
+        self._dirty.pop(path, None)
+        self._polled.pop(path, None)
+
+    def _watch(self, path, new_dir=True):
+        """
+        Start watching path, adding an inotify watch for its
+        directory only if new_dir is true. Called with the lock held.
+        """
+
+        if self._fd is not None:
+            dir = os.path.dirname(path)
+            if dir in self._dirs:
+                self._polled.pop(path, None)
+                return
+            if new_dir:
+                wd = _libc.inotify_add_watch(self._fd, dir, _IN_MASK)
+                if wd >= 0:
+                    self._dirs[dir] = wd
+                    self._wds[wd] = dir
+                    self._polled.pop(path, None)
+                    return
+
+        # no inotify, or the directory could not
+        # be watched (e.g. out of watches), poll it
+        self._polled[path] = None
+
+    def _run(self):
+
+        while not self._stop:
+            if self._fd is not None:
+                try:
+                    r, w, x = select.select([self._fd], [], [], self.interval)
+                except (select.error, OSError):
+                    r = []
+                if r:
+                    self._read_events()
+            else:
+                time.sleep(self.interval)
+
+            if self._polled:
+                self._poll()
+
+    def _read_events(self):
+
+        try:
+            buf = os.read(self._fd, 65536)
+        except OSError:
+            return
+
+        dirty, gone = {}, {}
+        overflow = False
+        i = 0
+        while i + _EVENT_HDR_SIZE <= len(buf):
+            wd, mask, cookie, length = struct.unpack(
+                _EVENT_HDR, buf[i:i+_EVENT_HDR_SIZE])
+            name = buf[i+_EVENT_HDR_SIZE:i+_EVENT_HDR_SIZE+length].rstrip("\0")
+            i = i + _EVENT_HDR_SIZE + length
+
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif mask & IN_IGNORED:
+                # the directory is no longer watched (e.g. removed)
+                dir = self._wds.get(wd)
+                if dir is not None:
+                    gone[dir] = wd
+            elif name:
+                dir = self._wds.get(wd)
+                if dir is not None:
+                    dirty[os.path.join(dir, name)] = None
+
+        self._lock.acquire()
+        try:
+            if gone:
+                # forget the files in directories no longer watched,
+                # mtime() will stat them and start watching again
+                for dir, wd in gone.items():
+                    del self._dirs[dir]
+                    del self._wds[wd]
+                for path in self._mtimes.keys() + self._missing.keys():
+                    if os.path.dirname(path) in gone:
+                        self._forget(path)
+            if overflow:
+                # events were lost, every file has to be checked again
+                for path in self._mtimes.keys() + self._missing.keys():
+                    self._dirty[path] = None
+            else:
+                for path in dirty.keys():
+                    if path in self._mtimes or path in self._missing:
+                        self._dirty[path] = None
+        finally:
+            self._lock.release()
+
+    def _poll(self):
+
+        self._lock.acquire()
+        try:
+            paths = [(p, self._mtimes.get(p)) for p in self._polled.keys()]
+        finally:
+            self._lock.release()
+
+        changed = [p for (p, mtime) in paths if _stat_mtime(p) != mtime]
+
+        if changed:
+            self._lock.acquire()
+            try:
+                for path in changed:
+                    if path in self._polled:
+                        self._dirty[path] = None
+            finally:
+                self._lock.release()
+
+def _stat_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return _MISSING
+
+_watcher = None
+
+def start(interval, use_inotify=True):
+    """
+    Start watching files in this process, checking for changes
+    at least every interval seconds.
+    """
+
+    global _watcher
+
+    if _watcher is None:
+        _watcher = FileWatcher(interval, use_inotify)
+    _watcher.start()
+    return _watcher
+
+def running():
+    """ True if a watcher is running in this process. """
+    return _watcher is not None and _watcher.running()
+
+def mtime(path):
+    """
+    Return the modification time of path, or None if it does not
+    exist. If a watcher is running, the file is only stat'ed when
+    it may have changed.
+    """
+
+    if _watcher is not None:
+        if not _watcher.running():
+            # we have been forked
+            _watcher.start()
+        return _watcher.mtime(path)
+
+    return _stat_mtime(path)
@@ -225,6 +225,68 @@ static PyObject *parse_qs(PyObject *self, PyObject *args)
     return dict;
 }
 
+/**
+ ** qsl_pair
+ **
+ *   Makes a (key, value) tuple of the "key=value" pair of plen
+ *   bytes at cpair, replacing '+' with ' ' and unescaping. Returns
+ *   None if the value is blank and blank values are not kept.
+ */
+
+static PyObject *qsl_pair(const char *cpair, long plen, int keep_blank_values)
+{
+    PyObject *key, *val;
+    char *ckey, *cval;
+    const char *eq;
+    long k, v, i;
+
+    /* split the "abc=def" pair */
+    eq = memchr(cpair, '=', plen);
+    k = eq ? eq - cpair : plen;
+    v = eq ? plen - k - 1 : 0;
+
+    if (! keep_blank_values && v == 0) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    /* PYTHON 2.5: 'PyString_FromStringAndSize' uses Py_ssize_t for input parameters */
+    key = PyString_FromStringAndSize(NULL, k);
+    if (key == NULL)
+        return NULL;
+    val = PyString_FromStringAndSize(NULL, v);
+    if (val == NULL) {
+        Py_DECREF(key);
+        return NULL;
+    }
+
+    ckey = PyString_AS_STRING(key);
+    cval = PyString_AS_STRING(val);
+
+    /* replace '+' with ' ' */
+    for (i = 0; i < k; i++)
+        ckey[i] = (cpair[i] == '+') ? ' ' : cpair[i];
+    for (i = 0; i < v; i++)
+        cval[i] = (cpair[k + 1 + i] == '+') ? ' ' : cpair[k + 1 + i];
+    ckey[k] = '\0';
+    cval[v] = '\0';
+
+    ap_unescape_url(ckey);
+    ap_unescape_url(cval);
+
+    /* PYTHON 2.5: '_PyString_Resize' uses Py_ssize_t for input parameters */
+    _PyString_Resize(&key, strlen(ckey));
+    _PyString_Resize(&val, strlen(cval));
+
+    if (! key || ! val) {
+        Py_XDECREF(key);
+        Py_XDECREF(val);
+        return NULL;
+    }
+
+    return Py_BuildValue("(NN)", key, val);
+}
+
 /**
  ** parse_qsl
  **
@@ -234,8 +296,8 @@ static PyObject *parse_qs(PyObject *self, PyObject *args)
 static PyObject *parse_qsl(PyObject *self, PyObject *args)
 {
 
-    PyObject *pairs;
-    int i, len;
+    PyObject *pairs, *pair;
+    int i, j, len;
     char *qs;
     int keep_blank_values = 0;
     int strict_parsing = 0; /* XXX not implemented */
@@ -255,97 +317,355 @@ static PyObject *parse_qsl(PyObject *self, PyObject *args)
 
     while (i < len) {
 
-        PyObject *pair, *key, *val;
-        char *cpair, *ckey, *cval;
-        int plen, j, p, k, v;
-
-        /* PYTHON 2.5: 'PyString_FromStringAndSize' uses Py_ssize_t for input parameters */ 
-        pair = PyString_FromStringAndSize(NULL, len);
-        if (pair == NULL)
-            return NULL;
-
         /* split by '&' or ';' */
-        cpair = PyString_AS_STRING(pair);
-        j = 0;
-        while ((qs[i] != '&') && (qs[i] != ';') && (i < len)) {
-            /* replace '+' with ' ' */
-            cpair[j] = (qs[i] == '+') ? ' ' : qs[i];
-            i++;
+        j = i;
+        while ((j < len) && (qs[j] != '&') && (qs[j] != ';'))
             j++;
+
+        if (j > i) {
+            pair = qsl_pair(qs + i, j - i, keep_blank_values);
+            if (pair == NULL) {
+                Py_DECREF(pairs);
+                return NULL;
+            }
+            if (pair != Py_None)
+                PyList_Append(pairs, pair);
+            Py_DECREF(pair);
         }
 
-        if (j == 0) {
-            Py_XDECREF(pair);
-            i++;
+        i = j + 1;
+    }
+
+    return pairs;
+}
+
+/**
+ ** read_qsl_field(req, keep_blank_values, max_size)
+ **
+ *   Reads the next field of an application/x-www-form-urlencoded
+ *   request body, returning it as a (key, value) tuple like those
+ *   of parse_qsl(), or None at the end of the body. The body is
+ *   read into the request read buffer as needed, so only the field
+ *   being parsed is ever held in memory. Raises ValueError if the
+ *   field ("key=value") is longer than max_size bytes, unless
+ *   max_size is negative.
+ */
+
+static PyObject *read_qsl_field(PyObject *self, PyObject *args)
+{
+    requestobject *req;
+    int keep_blank_values = 0;
+    long max_size = -1;
+    char *buf, *field = NULL, *tmp;
+    long pos, end, i, n, rc, field_len = 0, field_size = 0;
+    int eof = 0, sep;
+    PyObject *pair;
+
+    if (! PyArg_ParseTuple(args, "O|il", &req, &keep_blank_values, &max_size))
+        return NULL;
+
+    if (! MpRequest_Check(req)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "first argument must be a request object");
+        return NULL;
+    }
+
+    while (1) {
+
+        buf = req->rbuff;
+        pos = req->rbuff_pos;
+        end = buf ? req->rbuff_len : 0;
+
+        if (pos >= end && ! eof) {
+            rc = MpRequest_FillBuffer(req);
+            if (rc == -1)
+                goto error;
+            if (rc == 0)
+                eof = 1;
             continue;
         }
 
-        cpair[j] = '\0';
-        /* PYTHON 2.5: '_PyString_Resize' uses Py_ssize_t for input parameters */ 
-        _PyString_Resize(&pair, j);
-        cpair = PyString_AS_STRING(pair);
+        /* split by '&' or ';' */
+        for (i = pos; i < end && buf[i] != '&' && buf[i] != ';'; i++)
+            ;
+        n = i - pos;
+        sep = i < end;
+
+        if (max_size >= 0 && field_len + n > max_size) {
+            PyErr_SetString(PyExc_ValueError, "form field too large");
+            goto error;
+        }
 
-        /* split the "abc=def" pair */
-        plen = strlen(cpair);
-        /* PYTHON 2.5: 'PyString_FromStringAndSize' uses Py_ssize_t for input parameters */ 
-        key = PyString_FromStringAndSize(NULL, plen);
-        if (key == NULL) 
-            return NULL;
-        /* PYTHON 2.5: 'PyString_FromStringAndSize' uses Py_ssize_t for input parameters */ 
-        val = PyString_FromStringAndSize(NULL, plen);
-        if (val == NULL) 
-            return NULL;
+        req->rbuff_pos = sep ? i + 1 : i;
 
-        ckey = PyString_AS_STRING(key);
-        cval = PyString_AS_STRING(val);
+        if (sep && field_len == 0) {
+            /* the whole field is in the buffer */
+            if (n == 0)
+                continue;
+            pair = qsl_pair(buf + pos, n, keep_blank_values);
+        }
+        else {
+            /* the field is split across reads, collect it */
+            if (field_len + n > field_size) {
+                field_size = (field_len + n) * 2;
+                tmp = PyMem_Realloc(field, field_size);
+                if (! tmp) {
+                    PyErr_NoMemory();
+                    goto error;
+                }
+                field = tmp;
+            }
+            if (n > 0) {
+                memcpy(field + field_len, buf + pos, n);
+                field_len += n;
+            }
 
-        p = 0;
-        k = 0;
-        v = 0;
-        while (p < plen) {
-            if (cpair[p] != '=') {
-                ckey[k] = cpair[p];
-                k++;
-                p++;
+            if (! sep && ! eof)
+                continue;
+            if (field_len == 0) {
+                /* the end of the body */
+                PyMem_Free(field);
+                Py_INCREF(Py_None);
+                return Py_None;
             }
-            else {
-                p++;      /* skip '=' */
-                while (p < plen) {
-                    cval[v] = cpair[p];
-                    v++;
-                    p++;
-                }
+            pair = qsl_pair(field, field_len, keep_blank_values);
+            field_len = 0;
+        }
+
+        if (pair != Py_None) {
+            PyMem_Free(field);
+            return pair;
+        }
+        Py_DECREF(pair);
+    }
+
+error:
+    PyMem_Free(field);
+    return NULL;
+}
+
+/**
+ ** find_bytes
+ **
+ *   Boyer-Moore-Horspool search for needle (m bytes) in hay
+ *   (n bytes), skip is the bad character table for needle.
+ */
+
+static const char *find_bytes(const char *hay, long n,
+                              const char *needle, long m,
+                              const long *skip)
+{
+    long i = 0;
+    unsigned char c;
+
+    while (i <= n - m) {
+        c = (unsigned char)hay[i + m - 1];
+        if (c == (unsigned char)needle[m - 1] &&
+            memcmp(hay + i, needle, m - 1) == 0)
+            return hay + i;
+        i += skip[c];
+    }
+
+    return NULL;
+}
+
+/**
+ ** match_boundary
+ **
+ *   Checks whether p (n bytes) starts with a boundary line, i.e.
+ *   "--" boundary ["--"] ["\r"] "\n". Returns 1 and sets consumed
+ *   to the length of the line and final if it ends with "--", 0 if
+ *   it does not, and -1 if n bytes are not enough to tell.
+ */
+
+static int match_boundary(const char *p, long n, const char *boundary,
+                          long blen, long *consumed, int *final)
+{
+    long i = blen + 2;
+
+    if (memcmp(p, "--", n < 2 ? n : 2) != 0)
+        return 0;
+    if (n > 2 && memcmp(p + 2, boundary, n - 2 < blen ? n - 2 : blen) != 0)
+        return 0;
+    if (n <= i)
+        return -1;
+
+    *final = 0;
+    if (p[i] == '-') {
+        if (i + 1 >= n)
+            return -1;
+        if (p[i + 1] != '-')
+            return 0;
+        *final = 1;
+        i += 2;
+    }
+    if (i < n && p[i] == '\r')
+        i++;
+    if (i >= n)
+        return -1;
+    if (p[i] != '\n')
+        return 0;
+
+    *consumed = i + 1;
+    return 1;
+}
+
+/**
+ ** read_to_boundary(req, boundary, file)
+ **
+ *   Reads a part of a multipart request body up to and including
+ *   the next boundary line, writing the part data to file (unless
+ *   file is None) in blocks as large as the request read buffer.
+ *   The line break before the boundary line is not part of the
+ *   data. Returns True if that was the last part, i.e. the boundary
+ *   line ended with "--" or the body ended, False otherwise.
+ *
+ *   This is what util.FieldStorage.read_to_boundary() does line by
+ *   line, but searching the request read buffer for the boundary
+ *   directly. What follows the boundary line is left in the buffer
+ *   for req.readline().
+ */
+
+static PyObject *write_part(PyObject *write, const char *data, long len)
+{
+    if (write && len > 0)
+        return PyObject_CallFunction(write, "s#", data, (int)len);
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject *read_to_boundary(PyObject *self, PyObject *args)
+{
+    requestobject *req;
+    PyObject *file, *write = NULL, *r;
+    char *boundary, *pattern, *buf;
+    const char *p;
+    int blen, final = 0, found, more, eof = 0, at_start = 1;
+    long plen, start, end, keep, data_end = 0, next = 0, consumed, m, s, rc;
+    long skip[256];
+    int i;
+
+    if (! PyArg_ParseTuple(args, "Os#O", &req, &boundary, &blen, &file))
+        return NULL;
+
+    if (! MpRequest_Check(req)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "first argument must be a request object");
+        return NULL;
+    }
+
+    /* RFC 2046 boundaries are at most 70 characters */
+    if (blen == 0 || blen > 200) {
+        PyErr_SetString(PyExc_ValueError, "invalid boundary");
+        return NULL;
+    }
+
+    if (file != Py_None && ! (write = PyObject_GetAttrString(file, "write")))
+        return NULL;
+
+    /* boundary lines are searched for as "\n--boundary" */
+    plen = blen + 3;
+    pattern = PyMem_Malloc(plen);
+    if (! pattern) {
+        Py_XDECREF(write);
+        return PyErr_NoMemory();
+    }
+    memcpy(pattern, "\n--", 3);
+    memcpy(pattern + 3, boundary, blen);
+
+    for (i = 0; i < 256; i++)
+        skip[i] = plen;
+    for (i = 0; i < plen - 1; i++)
+        skip[(unsigned char)pattern[i]] = plen - 1 - i;
+
+    while (1) {
+
+        buf = req->rbuff;
+        start = req->rbuff_pos;
+        end = buf ? req->rbuff_len : 0;
+        keep = start;
+        found = more = 0;
+
+        /* the part may start with the boundary line */
+        if (at_start) {
+            rc = buf ? match_boundary(buf + start, end - start, boundary,
+                                      blen, &consumed, &final) : -1;
+            if (rc == 1) {
+                found = 1;
+                data_end = start;
+                next = start + consumed;
             }
+            else if (rc == -1 && !eof)
+                more = 1;
+            else
+                at_start = 0;
         }
-        ckey[k] = '\0';
-        cval[v] = '\0';
 
-        if (keep_blank_values || (v > 0)) {
+        s = start;
+        while (!found && !more) {
 
-            ap_unescape_url(ckey);
-            ap_unescape_url(cval);
+            p = find_bytes(buf + s, end - s, pattern, plen, skip);
 
-            /* PYTHON 2.5: '_PyString_Resize' uses Py_ssize_t for input parameters */
-            _PyString_Resize(&key, strlen(ckey));
-            /* PYTHON 2.5: '_PyString_Resize' uses Py_ssize_t for input parameters */
-            _PyString_Resize(&val, strlen(cval));
+            if (! p) {
+                /* what could be the beginning of a boundary
+                 * line is kept for the next round */
+                keep = end - plen > start ? end - plen : start;
+                break;
+            }
 
-            if (key && val) {
-                PyObject* listitem = Py_BuildValue("(O,O)", key, val);
-                if(listitem) {
-                    PyList_Append(pairs, listitem);
-                    Py_DECREF(listitem);
-                }
+            m = p - buf;
+            rc = match_boundary(buf + m + 1, end - m - 1, boundary, blen,
+                                &consumed, &final);
+            if (rc == 1) {
+                found = 1;
+                /* the \r\n before the boundary is not data, a lone
+                 * \n is (as with the line by line parser) */
+                data_end = (m > start && buf[m - 1] == '\r') ? m - 1 : m + 1;
+                next = m + 1 + consumed;
             }
+            else if (rc == -1 && !eof) {
+                more = 1;
+                keep = m > start ? m - 1 : start;
+            }
+            else
+                s = m + 1;
+        }
 
+        if (found || eof) {
+            if (! found) {
+                data_end = next = end;
+                final = 1;
+            }
+            r = write_part(write, buf + start, data_end - start);
+            if (! r)
+                goto error;
+            Py_DECREF(r);
+            req->rbuff_pos = next;
+            break;
         }
-        Py_XDECREF(pair);
-        Py_XDECREF(key);
-        Py_XDECREF(val);
-        i++;
+
+        r = write_part(write, buf + start, keep - start);
+        if (! r)
+            goto error;
+        Py_DECREF(r);
+        req->rbuff_pos = keep;
+
+        rc = MpRequest_FillBuffer(req);
+        if (rc == -1)
+            goto error;
+        if (rc == 0)
+            eof = 1;
     }
 
-    return pairs;
+    PyMem_Free(pattern);
+    Py_XDECREF(write);
+    return PyBool_FromLong(final);
+
+error:
+    PyMem_Free(pattern);
+    Py_XDECREF(write);
+    return NULL;
 }
 
 /**
@@ -746,6 +1066,8 @@ static PyMethodDef _apache_module_methods[] = {
     {"mpm_query",             (PyCFunction)mpm_query,            METH_O},
     {"parse_qs",              (PyCFunction)parse_qs,             METH_VARARGS},
     {"parse_qsl",             (PyCFunction)parse_qsl,            METH_VARARGS},
+    {"read_qsl_field",        (PyCFunction)read_qsl_field,       METH_VARARGS},
+    {"read_to_boundary",      (PyCFunction)read_to_boundary,     METH_VARARGS},
     {"server_root",           (PyCFunction)server_root,          METH_NOARGS},
     {"register_cleanup",      (PyCFunction)register_cleanup,     METH_VARARGS},
     {"exists_config_define",  (PyCFunction)exists_config_define, METH_VARARGS},
@@ -779,6 +1101,7 @@ DL_EXPORT(void) init_apache()
     PyDict_SetItemString(d, "SERVER_RETURN", Mp_ServerReturn);
 
     PyDict_SetItemString(d, "table", (PyObject *)&MpTable_Type);
+    PyDict_SetItemString(d, "request", (PyObject *)&MpRequest_Type);
 
     o = PyInt_FromLong(AP_CONN_UNKNOWN);
     PyDict_SetItemString(d, "AP_CONN_UNKNOWN", o);
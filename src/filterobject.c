@@ -101,6 +101,7 @@ PyObject *MpFilter_FromFilter(ap_filter_t *f, apr_bucket_brigade *bb, int is_inp
         result->readbytes = 0;
     }
 
+    result->bb_out_strings = NULL;
     result->closed = 0;
     result->softspace = 0;
 
@@ -367,11 +368,26 @@ static PyObject *filter_write(filterobject *self, PyObject *args)
                                               c->bucket_alloc);
         }
         
-        buff = apr_bucket_alloc(len, c->bucket_alloc);
-        memcpy(buff, PyString_AS_STRING(s), len);
+        if (!self->is_input && len >= AP_MIN_BYTES_TO_WRITE) {
+
+            /* large strings are not copied, the string is kept
+             * alive until bb_out has been passed on */
+            if (!self->bb_out_strings &&
+                !(self->bb_out_strings = PyList_New(0)))
+                return NULL;
+            if (PyList_Append(self->bb_out_strings, s) == -1)
+                return NULL;
+
+            b = apr_bucket_transient_create(PyString_AS_STRING(s), len,
+                                            c->bucket_alloc);
+        }
+        else {
+            buff = apr_bucket_alloc(len, c->bucket_alloc);
+            memcpy(buff, PyString_AS_STRING(s), len);
 
-        b = apr_bucket_heap_create(buff, len, apr_bucket_free,
-                                   c->bucket_alloc);
+            b = apr_bucket_heap_create(buff, len, apr_bucket_free,
+                                       c->bucket_alloc);
+        }
 
         APR_BRIGADE_INSERT_TAIL(self->bb_out, b);
     }
@@ -406,6 +422,7 @@ static PyObject *filter_flush(filterobject *self, PyObject *args)
         self->rc = ap_pass_brigade(self->f->next, self->bb_out);
         apr_brigade_destroy(self->bb_out);
         Py_END_ALLOW_THREADS;
+        Py_CLEAR(self->bb_out_strings);
 
         if(self->rc != APR_SUCCESS) { 
             PyErr_SetString(PyExc_IOError, "Flush failed.");
@@ -446,6 +463,7 @@ static PyObject *filter_close(filterobject *self, PyObject *args)
             apr_brigade_destroy(self->bb_out);
             Py_END_ALLOW_THREADS;
             self->bb_out = NULL;
+            Py_CLEAR(self->bb_out_strings);
         }
 
         self->closed = 1;
@@ -510,6 +528,7 @@ static PyMemberDef filter_memberlist[] = {
 static void filter_dealloc(filterobject *self)
 {  
     Py_XDECREF(self->request_obj);
+    Py_XDECREF(self->bb_out_strings);
     PyObject_Del(self);
 }
 
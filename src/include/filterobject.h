@@ -36,6 +36,7 @@ extern "C" {
            filter, not the filter type */
         apr_bucket_brigade *bb_in; 
         apr_bucket_brigade *bb_out;
+        PyObject *bb_out_strings; /* strings bb_out refers to */
 
         apr_status_t rc;
 
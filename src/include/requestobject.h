@@ -46,18 +46,30 @@ extern "C" {
         int              content_type_set;
         apr_off_t        bytes_queued;
         hlistobject    * hlo;
-        char           * rbuff;       /* read bufer */
-        int              rbuff_len;   /* read buffer size */
+        char           * rbuff;       /* read buffer, RBUFF_SIZE bytes */
+        int              rbuff_len;   /* bytes in the read buffer */
         int              rbuff_pos;   /* position into the buffer */
+        char           * wbuff;       /* write buffer */
+        apr_size_t       wbuff_size;  /* write buffer size, 0 == no buffering */
+        apr_size_t       wbuff_len;   /* bytes in the write buffer */
+        apr_interval_time_t wbuff_interval; /* flush at least this often */
+        apr_time_t       wbuff_time;  /* time of the last flush */
+        int              wbuff_init;  /* output buffer options read */
+        apr_bucket_brigade * wbb;     /* for writes that are not copied */
         PyObject       * session;
 	
     } requestobject;
 
+    /* size of the read buffer (rbuff) */
+#define RBUFF_SIZE 65536
+
     extern DL_IMPORT(PyTypeObject) MpRequest_Type;
     
 #define MpRequest_Check(op) ((op)->ob_type == &MpRequest_Type)
     
     extern DL_IMPORT(PyObject *) MpRequest_FromRequest Py_PROTO((request_rec *r));
+    extern DL_IMPORT(int) MpRequest_FlushBuffer Py_PROTO((requestobject *self, int flush));
+    extern DL_IMPORT(long) MpRequest_FillBuffer Py_PROTO((requestobject *self));
 
 #ifdef __cplusplus
 }
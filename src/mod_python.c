@@ -38,6 +38,27 @@ static PyObject * interpreters = NULL;
 static apr_thread_mutex_t* interpreters_lock = 0;
 #endif
 
+/* Thread states are kept for the lifetime of the thread, one for
+ * every interpreter the thread has used, rather than being created
+ * and destroyed on each get_interpreter()/release_interpreter().
+ * The same per-thread list lets get_interpreter() find interpreters
+ * the thread has used before without taking interpreters_lock.
+ * This is enabled in the child processes only. */
+typedef struct tstate_entry {
+    char *name;                 /* interpreter name */
+    interpreterdata *idata;
+    PyThreadState *tstate;
+    int depth;                  /* nested get_interpreter() calls */
+    struct tstate_entry *next;
+} tstate_entry;
+
+static int tstate_cache_enabled = 0;
+#if APR_HAS_THREADS
+static apr_threadkey_t *tstate_key = NULL;
+#else
+static tstate_entry *tstate_list = NULL;
+#endif
+
 apr_pool_t *child_init_pool = NULL;
 
 /* Optional functions imported from mod_include when loaded: */
@@ -229,6 +250,145 @@ PyObject *python_interpreter_name()
     return 0;
 }
 
+/**
+ ** tstate_cache_get
+ **
+ *      Get the list of thread states of the current thread.
+ */
+
+static tstate_entry *tstate_cache_get(void)
+{
+#if APR_HAS_THREADS
+    void *data = NULL;
+    apr_threadkey_private_get(&data, tstate_key);
+    return (tstate_entry *)data;
+#else
+    return tstate_list;
+#endif
+}
+
+/**
+ ** tstate_cache_set
+ **
+ *      Set the list of thread states of the current thread.
+ */
+
+static void tstate_cache_set(tstate_entry *list)
+{
+#if APR_HAS_THREADS
+    apr_threadkey_private_set((void *)list, tstate_key);
+#else
+    tstate_list = list;
+#endif
+}
+
+/**
+ ** tstate_cache_destroy
+ **
+ *      Delete a list of cached thread states. This is the destructor
+ *      of the thread key, so it runs when a thread exits.
+ */
+
+static void tstate_cache_destroy(void *data)
+{
+    tstate_entry *e = (tstate_entry *)data;
+    tstate_entry *next;
+
+    while (e) {
+        next = e->next;
+#ifdef WITH_THREAD
+        PyEval_AcquireThread(e->tstate);
+#else
+        PyThreadState_Swap(e->tstate);
+#endif
+        PyThreadState_Clear(e->tstate);
+#ifdef WITH_THREAD
+        PyEval_ReleaseThread(e->tstate);
+#else
+        PyThreadState_Swap(NULL);
+#endif
+        PyThreadState_Delete(e->tstate);
+        free(e->name);
+        free(e);
+        e = next;
+    }
+}
+
+/**
+ ** python_tstate_cleanup
+ **
+ *      Child exit cleanup, deletes the thread states cached by the
+ *      thread running the cleanups. Those of the worker threads are
+ *      deleted by tstate_cache_destroy() as the threads exit.
+ */
+
+static apr_status_t python_tstate_cleanup(void *data)
+{
+    tstate_entry *list;
+
+    if (!tstate_cache_enabled)
+        return APR_SUCCESS;
+
+    list = tstate_cache_get();
+    tstate_cache_set(NULL);
+    tstate_cache_enabled = 0;
+    tstate_cache_destroy(list);
+
+    return APR_SUCCESS;
+}
+
+/**
+ ** acquire_tstate
+ **
+ *      Make a thread state for the interpreter current and acquire
+ *      the lock. The thread state is reused if this thread has had
+ *      one for the interpreter before.
+ */
+
+static PyThreadState *acquire_tstate(const char *name, interpreterdata *idata)
+{
+    PyThreadState *tstate;
+    tstate_entry *e = NULL;
+
+    if (tstate_cache_enabled) {
+
+        for (e = tstate_cache_get(); e; e = e->next)
+            if (e->idata == idata)
+                break;
+
+        if (!e) {
+            e = (tstate_entry *)malloc(sizeof(tstate_entry));
+            if (e && !(e->name = strdup(name))) {
+                free(e);
+                e = NULL;
+            }
+            if (e) {
+                e->idata = idata;
+                e->tstate = PyThreadState_New(idata->istate);
+                e->depth = 0;
+                e->next = tstate_cache_get();
+                tstate_cache_set(e);
+            }
+        }
+    }
+
+    if (e) {
+        /* may be nested, e.g. a filter invoked by req.write() */
+        e->depth++;
+        tstate = e->tstate;
+    }
+    else
+        tstate = PyThreadState_New(idata->istate);
+
+#ifdef WITH_THREAD
+    PyEval_AcquireThread(tstate);
+#else
+    PyThreadState_Swap(tstate);
+#endif
+
+    return tstate;
+}
+
 /**
  ** get_interpreter
  **
@@ -236,15 +396,32 @@ PyObject *python_interpreter_name()
  *      NOTE: This function will acquire lock
  */
 
+static void release_interpreter(void);
+
 static interpreterdata *get_interpreter(const char *name)
 {
     PyObject *p;
-    PyThreadState *tstate;
     interpreterdata *idata = NULL;
+    tstate_entry *e;
 
     if (! name)
         name = MAIN_INTERPRETER;
 
+    /* Interpreters are never destroyed, so one this thread has
+     * used before can be taken from its own list without looking
+     * it up in the interpreters dictionary under the mutex. */
+    if (tstate_cache_enabled) {
+        for (e = tstate_cache_get(); e; e = e->next) {
+            if (strcmp(e->name, name) == 0) {
+                if (e->idata->obcallback) {
+                    acquire_tstate(name, e->idata);
+                    return e->idata;
+                }
+                break;
+            }
+        }
+    }
+
 #if APR_HAS_THREADS
     apr_thread_mutex_lock(interpreters_lock);
 #endif
@@ -293,13 +470,8 @@ static interpreterdata *get_interpreter(const char *name)
         return NULL;
     }
 
-    /* create thread state and acquire lock */
-    tstate = PyThreadState_New(idata->istate);
-#ifdef WITH_THREAD
-    PyEval_AcquireThread(tstate);
-#else
-    PyThreadState_Swap(tstate);
-#endif
+    /* get thread state and acquire lock */
+    acquire_tstate(name, idata);
 
     if (!idata->obcallback) {
 
@@ -307,13 +479,7 @@ static interpreterdata *get_interpreter(const char *name)
 
         if (!idata->obcallback)
         {
-            PyThreadState_Clear(tstate);
-#ifdef WITH_THREAD
-            PyEval_ReleaseThread(tstate);
-#else
-            PyThreadState_Swap(NULL);
-#endif
-            PyThreadState_Delete(tstate);
+            release_interpreter();
             ap_log_error(APLOG_MARK, APLOG_ERR, 0, main_server,
                       "get_interpreter: no interpreter callback found.");
 #if APR_HAS_THREADS
@@ -341,6 +507,29 @@ static interpreterdata *get_interpreter(const char *name)
 static void release_interpreter(void)
 {
     PyThreadState *tstate = PyThreadState_Get();
+    tstate_entry *e = NULL;
+
+    if (tstate_cache_enabled)
+        for (e = tstate_cache_get(); e; e = e->next)
+            if (e->tstate == tstate)
+                break;
+
+    if (e) {
+        /* keep the thread state, but leave nothing behind for
+         * whatever runs in it next: no exception, trace function
+         * or thread local data (tstate->dict). There is no frame
+         * left at depth 0, so clearing it is as safe as before
+         * deleting it. */
+        if (--e->depth == 0)
+            PyThreadState_Clear(tstate);
+#ifdef WITH_THREAD
+        PyEval_ReleaseThread(tstate);
+#else
+        PyThreadState_Swap(NULL);
+#endif
+        return;
+    }
+
     PyThreadState_Clear(tstate);
 #ifdef WITH_THREAD
     PyEval_ReleaseThread(tstate);
@@ -1575,6 +1764,10 @@ static int python_handler(request_rec *req, char *phase)
     resultobject = PyObject_CallMethod(idata->obcallback, "HandlerDispatch",
                                        "O", request_obj);
 
+    /* pass on buffered output, without flushing it so that
+     * the content length can still be determined */
+    MpRequest_FlushBuffer(request_obj, 0);
+
     /* clear phase from request object */
     Py_XDECREF(request_obj->phase);
     request_obj->phase = NULL;
@@ -1883,6 +2076,13 @@ static apr_status_t python_filter(int is_input, ap_filter_t *f,
     resultobject = PyObject_CallMethod(idata->obcallback, "FilterDispatch", "O",
                                        filter);
 
+    /* output that was written but never passed on is dropped, so
+     * that the strings it refers to can be released */
+    if (!is_input && filter->bb_out_strings) {
+        apr_brigade_cleanup(filter->bb_out);
+        Py_CLEAR(filter->bb_out_strings);
+    }
+
     /* clean up */
     Py_XDECREF(resultobject);
 
@@ -2665,6 +2865,24 @@ static void PythonChildInitHandler(apr_pool_t *p, server_rec *s)
      * end the Python interpreter *after* all other cleanups.
      */
 
+    /*
+     * From now on thread states are kept per thread and interpreter
+     * and reused. The ones left at child exit are deleted last.
+     * Starting httpd with -DPYTHON_NO_TSTATE_CACHE disables this,
+     * which is only meant for comparing the two.
+     */
+    if (!ap_exists_config_define("PYTHON_NO_TSTATE_CACHE")) {
+#if APR_HAS_THREADS
+        if (apr_threadkey_private_create(&tstate_key, tstate_cache_destroy,
+                                         p) == APR_SUCCESS)
+            tstate_cache_enabled = 1;
+#else
+        tstate_cache_enabled = 1;
+#endif
+    }
+    apr_pool_cleanup_register(p, NULL, python_tstate_cleanup,
+                              apr_pool_cleanup_null);
+
     /*
      * XXX Trying to cleanup Python on process shutdown causes
      * problems. This seems to mainly be an issue where there
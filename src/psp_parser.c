@@ -511,13 +511,32 @@ static yyconst flex_int16_t yy_chk[115] =
 
 #define CLEAR_WHITESPACE(__wsstring) psp_string_clear((__wsstring));
 
+/* If the static text being closed is empty, remove the req.write()
+ * which was started for it and return 1, so that no call is made to
+ * write nothing.  The text itself can not end like this because its
+ * quotes are escaped.
+ */
+static int drop_empty_text(psp_string *pycode)
+{
+    static const char start[] = "req.write(\"\"\"";
+    size_t len = sizeof(start) - 1;
+
+    if (pycode->length >= len &&
+        memcmp(pycode->blob + pycode->length - len, start, len) == 0) {
+        pycode->length -= len;
+        return 1;
+    }
+
+    return 0;
+}
+
 #define YY_NO_UNISTD_H 1
 
 
 
 
 
-#line 520 "psp_parser.c"
+#line 539 "psp_parser.c"
 
 #define INITIAL 0
 #define TEXT 1
@@ -746,10 +765,10 @@ YY_DECL
 	register int yy_act;
     struct yyguts_t * yyg = (struct yyguts_t*)yyscanner;
 
-#line 46 "psp_parser.l"
+#line 65 "psp_parser.l"
 
 
-#line 752 "psp_parser.c"
+#line 771 "psp_parser.c"
 
 	if ( !yyg->yy_init )
 		{
@@ -836,7 +855,7 @@ do_action:	/* This label is used only to access EOF actions. */
 case 1:
 /* rule 1 can match eol */
 YY_RULE_SETUP
-#line 48 "psp_parser.l"
+#line 67 "psp_parser.l"
 {
     psp_string_appendl(&PSP_PG(pycode), STATIC_STR("req.write(\"\"\"")); 
 
@@ -846,7 +865,7 @@ YY_RULE_SETUP
 	YY_BREAK
 case 2:
 YY_RULE_SETUP
-#line 55 "psp_parser.l"
+#line 74 "psp_parser.l"
 {
     psp_string_appendl(&PSP_PG(pycode), STATIC_STR("req.write(\"\"\"")); 
 
@@ -856,30 +875,35 @@ YY_RULE_SETUP
 	YY_BREAK
 case 3:
 YY_RULE_SETUP
-#line 62 "psp_parser.l"
+#line 81 "psp_parser.l"
 {
     psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\\\\n"));
 }
 	YY_BREAK
 case 4:
 YY_RULE_SETUP
-#line 66 "psp_parser.l"
+#line 85 "psp_parser.l"
 {
     psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\\\\r"));
 }
 	YY_BREAK
 case 5:
 YY_RULE_SETUP
-#line 70 "psp_parser.l"
+#line 89 "psp_parser.l"
 {
     psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\\\\t"));
 }
 	YY_BREAK
 case 6:
 YY_RULE_SETUP
-#line 74 "psp_parser.l"
+#line 93 "psp_parser.l"
 {    /* expression */
-    psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\"\"\",0); req.write(str("));
+    if (drop_empty_text(&PSP_PG(pycode))) {
+        psp_string_appendl(&PSP_PG(pycode), STATIC_STR("req.write(str("));
+    }
+    else {
+        psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\"\"\",0); req.write(str("));
+    }
     PSP_PG(is_psp_echo) = 1;
 
     BEGIN PYCODE;
@@ -887,9 +911,15 @@ YY_RULE_SETUP
 	YY_BREAK
 case 7:
 YY_RULE_SETUP
-#line 81 "psp_parser.l"
+#line 105 "psp_parser.l"
 {     /* python code */
-    psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\"\"\",0);")); 
+    if (drop_empty_text(&PSP_PG(pycode))) {
+        /* keeps the indentation and a block that the text was in valid */
+        psp_string_appendl(&PSP_PG(pycode), STATIC_STR("pass;"));
+    }
+    else {
+        psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\"\"\",0);"));
+    }
     CLEAR_WHITESPACE(&PSP_PG(whitespace)); 
     PSP_PG(seen_newline) = 0;
     BEGIN PYCODE;
@@ -897,14 +927,14 @@ YY_RULE_SETUP
 	YY_BREAK
 case 8:
 YY_RULE_SETUP
-#line 88 "psp_parser.l"
+#line 118 "psp_parser.l"
 {     /* directive */
     BEGIN DIR;
 }
 	YY_BREAK
 case 9:
 YY_RULE_SETUP
-#line 92 "psp_parser.l"
+#line 122 "psp_parser.l"
 {    /* comment */
     BEGIN COMMENT;
 }
@@ -912,14 +942,14 @@ YY_RULE_SETUP
 case 10:
 /* rule 10 can match eol */
 YY_RULE_SETUP
-#line 96 "psp_parser.l"
+#line 126 "psp_parser.l"
 {
     psp_string_appendc(&PSP_PG(pycode), '\n');
 }
 	YY_BREAK
 case 11:
 YY_RULE_SETUP
-#line 100 "psp_parser.l"
+#line 130 "psp_parser.l"
 {
     if (yytext[0] == '"') {
         psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\\\""));
@@ -929,12 +959,17 @@ YY_RULE_SETUP
 }
 	YY_BREAK
 case YY_STATE_EOF(TEXT):
-#line 108 "psp_parser.l"
+#line 138 "psp_parser.l"
 {
     yypop_buffer_state(yyscanner);
     if (!YY_CURRENT_BUFFER) {
         /* this is really the end */
-        psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\"\"\",0)\n"));
+        if (drop_empty_text(&PSP_PG(pycode))) {
+            psp_string_appendl(&PSP_PG(pycode), STATIC_STR("pass\n"));
+        }
+        else {
+            psp_string_appendl(&PSP_PG(pycode), STATIC_STR("\"\"\",0)\n"));
+        }
         yyterminate();
     }
     else {
@@ -946,7 +981,7 @@ case YY_STATE_EOF(TEXT):
 case 12:
 /* rule 12 can match eol */
 YY_RULE_SETUP
-#line 121 "psp_parser.l"
+#line 156 "psp_parser.l"
 {
     psp_string_appendc(&PSP_PG(pycode), '\n');
         
@@ -956,7 +991,7 @@ YY_RULE_SETUP
 	YY_BREAK
 case 13:
 YY_RULE_SETUP
-#line 128 "psp_parser.l"
+#line 163 "psp_parser.l"
 {
 
     if (PSP_PG(is_psp_echo)) {
@@ -984,7 +1019,7 @@ YY_RULE_SETUP
 	YY_BREAK
 case 14:
 YY_RULE_SETUP
-#line 153 "psp_parser.l"
+#line 188 "psp_parser.l"
 {
     psp_string_appendc(&PSP_PG(pycode), yytext[0]);
     PSP_PG(after_colon) = 1;
@@ -992,7 +1027,7 @@ YY_RULE_SETUP
 	YY_BREAK
 case 15:
 YY_RULE_SETUP
-#line 158 "psp_parser.l"
+#line 193 "psp_parser.l"
 {
     psp_string_appendc(&PSP_PG(pycode), yytext[0]);
     PSP_PG(after_colon) = 0;
@@ -1000,7 +1035,7 @@ YY_RULE_SETUP
 	YY_BREAK
 case 16:
 YY_RULE_SETUP
-#line 163 "psp_parser.l"
+#line 198 "psp_parser.l"
 {
 
     CLEAR_WHITESPACE(&PSP_PG(whitespace)); 
@@ -1012,7 +1047,7 @@ YY_RULE_SETUP
 	YY_BREAK
 case 17:
 YY_RULE_SETUP
-#line 172 "psp_parser.l"
+#line 207 "psp_parser.l"
 {
     yyless(0);
     BEGIN PYCODE;
@@ -1021,7 +1056,7 @@ YY_RULE_SETUP
 case 18:
 /* rule 18 can match eol */
 YY_RULE_SETUP
-#line 177 "psp_parser.l"
+#line 212 "psp_parser.l"
 {
     CLEAR_WHITESPACE(&PSP_PG(whitespace)); 
     yyless(0);
@@ -1030,7 +1065,7 @@ YY_RULE_SETUP
 	YY_BREAK
 case 19:
 YY_RULE_SETUP
-#line 183 "psp_parser.l"
+#line 218 "psp_parser.l"
 {
     CLEAR_WHITESPACE(&PSP_PG(whitespace)); 
     yyless(0);
@@ -1040,7 +1075,7 @@ YY_RULE_SETUP
 case 20:
 /* rule 20 can match eol */
 YY_RULE_SETUP
-#line 189 "psp_parser.l"
+#line 224 "psp_parser.l"
 {
 
     char *filename;
@@ -1084,24 +1119,24 @@ YY_RULE_SETUP
 	YY_BREAK
 case 21:
 YY_RULE_SETUP
-#line 231 "psp_parser.l"
+#line 266 "psp_parser.l"
 {
     BEGIN TEXT;
 }
 	YY_BREAK
 case 22:
 YY_RULE_SETUP
-#line 235 "psp_parser.l"
+#line 270 "psp_parser.l"
 {
     BEGIN TEXT;
 }
 	YY_BREAK
 case 23:
 YY_RULE_SETUP
-#line 239 "psp_parser.l"
+#line 274 "psp_parser.l"
 ECHO;
 	YY_BREAK
-#line 1104 "psp_parser.c"
+#line 1139 "psp_parser.c"
 case YY_STATE_EOF(INITIAL):
 case YY_STATE_EOF(PYCODE):
 case YY_STATE_EOF(INDENT):
@@ -2263,7 +2298,7 @@ void yyfree (void * ptr , yyscan_t yyscanner)
 
 #define YYTABLES_NAME "yytables"
 
-#line 239 "psp_parser.l"
+#line 274 "psp_parser.l"
 
 
 
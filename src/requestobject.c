@@ -73,6 +73,13 @@ PyObject * MpRequest_FromRequest(request_rec *req)
     result->rbuff = NULL;
     result->rbuff_pos = 0;
     result->rbuff_len = 0;
+    result->wbuff = NULL;
+    result->wbuff_size = 0;
+    result->wbuff_len = 0;
+    result->wbuff_interval = 0;
+    result->wbuff_time = 0;
+    result->wbuff_init = 0;
+    result->wbb = NULL;
 
     /* we make sure that the object dictionary is there
      * before registering the object with the GC
@@ -921,6 +928,9 @@ static PyObject * req_internal_redirect(requestobject *self, PyObject *args)
     if (! PyArg_ParseTuple(args, "z", &new_uri))
         return NULL; /* error */
 
+    /* what was written so far goes out first */
+    MpRequest_FlushBuffer(self, 0);
+
     Py_BEGIN_ALLOW_THREADS
     ap_internal_redirect(new_uri, self->request_rec);
     Py_END_ALLOW_THREADS
@@ -967,47 +977,198 @@ static PyObject * req_meets_conditions(requestobject *self) {
 
 
 /**
- ** request.read(request self, int bytes)
+ ** setup_client_block
  **
- *     Reads stuff like POST requests from the client
- *     (based on the old net_read)
+ *     Prepares for reading the request body on the first read.
+ *     Returns 1 if there is a body to read, 0 if the client has
+ *     nothing to send and -1 with an exception set on error.
+ *     Chunked bodies are dechunked while reading if the
+ *     mod_python.request_body.chunked PythonOption is "dechunk".
  */
 
-static PyObject * req_read(requestobject *self, PyObject *args)
+static int setup_client_block(requestobject *self)
+{
+    int rc;
+    int read_policy = REQUEST_CHUNKED_ERROR;
+    py_config *conf;
+    const char *val;
+
+    if (self->request_rec->read_length)
+        return 1;
+
+    /* chunked request bodies are rejected (411) unless enabled */
+    conf = (py_config *) ap_get_module_config(self->request_rec->per_dir_config,
+                                              &python_module);
+    val = apr_table_get(conf->options, "mod_python.request_body.chunked");
+    if (val && !strcasecmp(val, "dechunk"))
+        read_policy = REQUEST_CHUNKED_DECHUNK;
+
+    rc = ap_setup_client_block(self->request_rec, read_policy);
+    if (rc != OK) {
+        PyObject *val = PyInt_FromLong(rc);
+        if (val == NULL)
+            return -1;
+        PyErr_SetObject(get_ServerReturn(), val);
+        Py_DECREF(val);
+        return -1;
+    }
+
+    return ap_should_client_block(self->request_rec) ? 1 : 0;
+}
+
+/**
+ ** take_buffered
+ **
+ *     Copies up to len bytes left in the read buffer by readline
+ *     to buffer, returns the number of bytes copied.
+ */
+
+static long take_buffered(requestobject *self, char *buffer, long len)
+{
+    long avail = self->rbuff_len - self->rbuff_pos;
+
+    if (avail > len)
+        avail = len;
+    if (avail > 0) {
+        memcpy(buffer, self->rbuff + self->rbuff_pos, avail);
+        self->rbuff_pos += avail;
+        return avail;
+    }
+    return 0;
+}
+
+/**
+ ** MpRequest_FillBuffer
+ **
+ *     Moves what is left in the read buffer to its start and reads
+ *     more of the request body in after it, allocating the buffer
+ *     on first use. Returns the number of bytes read, 0 at the end
+ *     of the body and -1 with an exception set on error.
+ */
+
+long MpRequest_FillBuffer(requestobject *self)
+{
+    int rc;
+    long chunk_len;
+    int left;
+
+    if ((rc = setup_client_block(self)) != 1)
+        return rc;
+
+    if (! self->rbuff) {
+        self->rbuff = malloc(RBUFF_SIZE);
+        if (! self->rbuff) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        self->rbuff_pos = self->rbuff_len = 0;
+    }
+
+    left = self->rbuff_len - self->rbuff_pos;
+    if (left > 0 && self->rbuff_pos > 0)
+        memmove(self->rbuff, self->rbuff + self->rbuff_pos, left);
+    self->rbuff_pos = 0;
+    self->rbuff_len = left > 0 ? left : 0;
+
+    Py_BEGIN_ALLOW_THREADS
+    chunk_len = ap_get_client_block(self->request_rec,
+                                    self->rbuff + self->rbuff_len,
+                                    RBUFF_SIZE - self->rbuff_len);
+    Py_END_ALLOW_THREADS
+
+    if (chunk_len == -1) {
+        PyErr_SetString(PyExc_IOError, "Client read error (Timeout?)");
+        return -1;
+    }
+
+    self->rbuff_len += chunk_len;
+    return chunk_len;
+}
+
+/**
+ ** read_all
+ **
+ *     Reads the rest of a request body of unknown length (i.e.
+ *     chunked) into a string which grows as needed.
+ */
+
+static PyObject * read_all(requestobject *self)
 {
-    int rc, bytes_read, chunk_len;
-    char *buffer;
     PyObject *result;
-    int copied = 0;
-    long len = -1;
+    Py_ssize_t size = HUGE_STRING_LEN;
+    Py_ssize_t copied;
+    long chunk_len;
 
-    if (! PyArg_ParseTuple(args, "|l", &len))
+    if (self->rbuff_len - self->rbuff_pos > size)
+        size = self->rbuff_len - self->rbuff_pos;
+
+    result = PyString_FromStringAndSize(NULL, size);
+    if (result == NULL)
         return NULL;
 
-    if (len == 0) {
-        return PyString_FromString("");
-    }
+    copied = take_buffered(self, PyString_AS_STRING(result), size);
 
-    /* is this the first read? */
-    if (! self->request_rec->read_length) {
+    while (1) {
 
-        /* then do some initial setting up */
-        rc = ap_setup_client_block(self->request_rec, REQUEST_CHUNKED_ERROR);
-        if(rc != OK) {
-            PyObject *val = PyInt_FromLong(rc);
-            if (val == NULL)
+        if (copied == size) {
+            size *= 2;
+            if (_PyString_Resize(&result, size))
                 return NULL;
-            PyErr_SetObject(get_ServerReturn(), val);
-            Py_DECREF(val);
-            return NULL;
         }
 
-        if (! ap_should_client_block(self->request_rec)) {
-            /* client has nothing to send */
-            return PyString_FromString("");
+        Py_BEGIN_ALLOW_THREADS
+        chunk_len = ap_get_client_block(self->request_rec,
+                                        PyString_AS_STRING(result) + copied,
+                                        size - copied);
+        Py_END_ALLOW_THREADS
+
+        if (chunk_len == -1) {
+            Py_DECREF(result);
+            PyErr_SetString(PyExc_IOError, "Client read error (Timeout?)");
+            return NULL;
         }
+        if (chunk_len == 0)
+            break;
+
+        copied += chunk_len;
+    }
+
+    if (copied < size)
+        if (_PyString_Resize(&result, copied))
+            return NULL;
+
+    return result;
+}
+
+/**
+ ** read_body
+ **
+ *     Reads up to len bytes of the request body into a new
+ *     string, all of it if len is negative.
+ */
+
+static PyObject * read_body(requestobject *self, long len)
+{
+    int rc, bytes_read, chunk_len;
+    char *buffer;
+    PyObject *result;
+    int copied = 0;
+
+    if (len == 0) {
+        return PyString_FromString("");
     }
 
+    /* is this the first read? */
+    if ((rc = setup_client_block(self)) == -1)
+        return NULL;
+    if (rc == 0)
+        /* client has nothing to send */
+        return PyString_FromString("");
+
+    if (len < 0 && self->request_rec->read_chunked)
+        /* the length is not known in advance */
+        return read_all(self);
+
     if (len < 0)
         /* XXX ok to use request_rec->remaining? */
         len = self->request_rec->remaining +
@@ -1023,23 +1184,14 @@ static PyObject * req_read(requestobject *self, PyObject *args)
     buffer = PyString_AS_STRING((PyStringObject *) result);
 
     /* if anything left in the readline buffer */
-    while ((self->rbuff_pos < self->rbuff_len) && (copied < len))
-        buffer[copied++] = self->rbuff[self->rbuff_pos++];
-
-    /* Free rbuff if we're done with it */
-    if (self->rbuff_pos >= self->rbuff_len && self->rbuff != NULL) {
-        free(self->rbuff);
-        self->rbuff = NULL;
-    }
+    copied = take_buffered(self, buffer, len);
 
     if (copied == len)
         return result;  /* we're done! */
 
     /* read it in */
-    Py_BEGIN_ALLOW_THREADS
-    chunk_len = ap_get_client_block(self->request_rec, buffer, len);
-    Py_END_ALLOW_THREADS
-    bytes_read = chunk_len;
+    bytes_read = copied;
+    chunk_len = -2;
 
     /* if this is a "short read", try reading more */
     while ((bytes_read < len) && (chunk_len != 0)) {
@@ -1066,185 +1218,225 @@ static PyObject * req_read(requestobject *self, PyObject *args)
 }
 
 /**
- ** request.readline(request self, int maxbytes)
+ ** request.read(request self, int bytes)
  **
  *     Reads stuff like POST requests from the client
- *     (based on the old net_read) until EOL
+ *     (based on the old net_read)
  */
 
-static PyObject * req_readline(requestobject *self, PyObject *args)
+static PyObject * req_read(requestobject *self, PyObject *args)
 {
-
-    int rc, chunk_len, bytes_read;
-    char *buffer;
-    PyObject *result;
-    int copied = 0;
     long len = -1;
 
     if (! PyArg_ParseTuple(args, "|l", &len))
         return NULL;
 
-    if (len == 0) {
-        return PyString_FromString("");
-    }
+    return read_body(self, len);
+}
 
-    /* is this the first read? */
-    if (! self->request_rec->read_length) {
+/**
+ ** request.readinto(request self, buffer)
+ **
+ *     Reads the request body into a writable buffer object
+ *     (e.g. a bytearray or memoryview) until it is full or there
+ *     is no more input, returns the number of bytes read.
+ */
+
+static PyObject * req_readinto(requestobject *self, PyObject *args)
+{
+    Py_buffer pbuf;
+    char *buffer;
+    Py_ssize_t len;
+    Py_ssize_t copied = 0;
+    long chunk_len;
+    int rc = 1;
 
-        /* then do some initial setting up */
-        rc = ap_setup_client_block(self->request_rec, REQUEST_CHUNKED_ERROR);
+    if (! PyArg_ParseTuple(args, "w*", &pbuf))
+        return NULL;
 
-        if (rc != OK) {
-            PyObject *val = PyInt_FromLong(rc);
-            if (val == NULL)
-                return NULL;
-            PyErr_SetObject(get_ServerReturn(), val);
-            Py_DECREF(val);
-            return NULL;
-        }
+    buffer = (char *)pbuf.buf;
+    len = pbuf.len;
+
+    if (len > 0)
+        rc = setup_client_block(self);
+
+    if (len > 0 && rc == 1) {
 
-        if (! ap_should_client_block(self->request_rec)) {
-            /* client has nothing to send */
-            return PyString_FromString("");
+        /* if anything left in the readline buffer */
+        copied = take_buffered(self, buffer, len);
+
+        while (copied < len) {
+            Py_BEGIN_ALLOW_THREADS
+            chunk_len = ap_get_client_block(self->request_rec,
+                                            buffer + copied, len - copied);
+            Py_END_ALLOW_THREADS
+            if (chunk_len == -1) {
+                PyErr_SetString(PyExc_IOError, "Client read error (Timeout?)");
+                rc = -1;
+                break;
+            }
+            if (chunk_len == 0)
+                break;
+            copied += chunk_len;
         }
     }
 
-    if (len < 0)
-        len = self->request_rec->remaining +
-            (self->rbuff_len - self->rbuff_pos);
-
-    /* create the result buffer */
-    /* PYTHON 2.5: 'PyString_FromStringAndSize' uses Py_ssize_t for input parameters */
-    result = PyString_FromStringAndSize(NULL, len);
+    PyBuffer_Release(&pbuf);
 
-    /* possibly no more memory */
-    if (result == NULL)
+    if (rc == -1)
         return NULL;
 
-    buffer = PyString_AS_STRING((PyStringObject *) result);
+    return PyInt_FromSsize_t(copied);
+}
 
-    /* is there anything left in the rbuff from previous reads? */
-    if (self->rbuff_pos < self->rbuff_len) {
+/**
+ ** request.iter_body(request self, int chunk_size)
+ **
+ *     Returns an iterator over the request body in strings of up
+ *     to chunk_size bytes. This is iter(callable, '') with a
+ *     callable which reads the next chunk, its self being a
+ *     (request, chunk_size) tuple.
+ */
 
-        /* if yes, process that first */
-        while (self->rbuff_pos < self->rbuff_len) {
+static PyObject * req_read_chunk(PyObject *self_size, PyObject *unused)
+{
+    requestobject *self = (requestobject *)PyTuple_GET_ITEM(self_size, 0);
+    long len = PyInt_AS_LONG(PyTuple_GET_ITEM(self_size, 1));
 
-            buffer[copied++] = self->rbuff[self->rbuff_pos];
-            if ((self->rbuff[self->rbuff_pos++] == '\n') ||
-                (copied == len)) {
+    return read_body(self, len);
+}
 
-                /* our work is done */
+static PyMethodDef req_read_chunk_def =
+    {"read_chunk", (PyCFunction) req_read_chunk, METH_NOARGS};
 
-                /* resize if necessary */
-                if (copied < len)
-                    /* PYTHON 2.5: '_PyString_Resize' uses Py_ssize_t for input parameters */
-                    if(_PyString_Resize(&result, copied))
-                        return NULL;
+static PyObject * req_iter_body(requestobject *self, PyObject *args)
+{
+    long chunk_size = HUGE_STRING_LEN;
+    PyObject *self_size, *read_chunk, *sentinel, *result;
 
-                /* fix for MODPYTHON-181 leak */
-                if (self->rbuff_pos >= self->rbuff_len && self->rbuff != NULL) {
-                    free(self->rbuff);
-                    self->rbuff = NULL;
-                }
+    if (! PyArg_ParseTuple(args, "|l", &chunk_size))
+        return NULL;
 
-                return result;
-            }
-        }
+    if (chunk_size <= 0) {
+        PyErr_SetString(PyExc_ValueError, "chunk_size must be positive");
+        return NULL;
     }
 
-    /* Free old rbuff as the old contents have been copied over and
-       we are about to allocate a new rbuff. Perhaps this could be reused
-       somehow? */
-    if (self->rbuff_pos >= self->rbuff_len && self->rbuff != NULL)
-    {
-        free(self->rbuff);
-        self->rbuff = NULL;
-    }
+    if (! (self_size = Py_BuildValue("(Ol)", self, chunk_size)))
+        return NULL;
 
-    /* if got this far, the buffer should be empty, we need to read more */
+    read_chunk = PyCFunction_New(&req_read_chunk_def, self_size);
+    Py_DECREF(self_size);
+    if (! read_chunk)
+        return NULL;
 
-    /* create a read buffer
+    if (! (sentinel = PyString_FromString(""))) {
+        Py_DECREF(read_chunk);
+        return NULL;
+    }
 
-       The buffer len will be at least HUGE_STRING_LEN in size,
-       to avoid memory fragmention
-    */
-    self->rbuff_len = len > HUGE_STRING_LEN ? len : HUGE_STRING_LEN;
-    self->rbuff_pos = 0;
-    self->rbuff = malloc(self->rbuff_len);
-    if (! self->rbuff)
-        return PyErr_NoMemory();
+    result = PyCallIter_New(read_chunk, sentinel);
+    Py_DECREF(read_chunk);
+    Py_DECREF(sentinel);
 
-    /* read it in */
-    Py_BEGIN_ALLOW_THREADS
-        chunk_len = ap_get_client_block(self->request_rec, self->rbuff,
-                                        self->rbuff_len);
-    Py_END_ALLOW_THREADS;
+    return result;
+}
 
-    /* ap_get_client_block could return -1 on error */
-    if (chunk_len == -1) {
+/**
+ ** read_line
+ **
+ *     Reads a line of at most len bytes (any length if len is
+ *     negative) from the request body. Input is read in blocks into
+ *     the fixed size rbuff, which is allocated on first use and kept
+ *     for the life of the request object, and scanned with memchr.
+ *     Returns an empty string at the end of the body.
+ */
 
-        /* Free rbuff since returning NULL here should end the request */
-        free(self->rbuff);
-        self->rbuff = NULL;
+static PyObject * read_line(requestobject *self, long len)
+{
+    int rc;
+    long chunk_len, avail, n;
+    Py_ssize_t copied = 0;
+    char *start, *nl;
+    PyObject *result = NULL;
+
+    if (len == 0)
+        return PyString_FromString("");
 
-        PyErr_SetObject(PyExc_IOError,
-                        PyString_FromString("Client read error (Timeout?)"));
+    /* is this the first read? */
+    if ((rc = setup_client_block(self)) == -1)
         return NULL;
-    }
+    if (rc == 0)
+        /* client has nothing to send */
+        return PyString_FromString("");
 
-    bytes_read = chunk_len;
+    while (1) {
 
-    /* if this is a "short read", try reading more */
-    while ((chunk_len != 0 ) && (bytes_read + copied < len)) {
+        if (self->rbuff_pos >= self->rbuff_len) {
 
-        Py_BEGIN_ALLOW_THREADS
-            chunk_len = ap_get_client_block(self->request_rec,
-                                            self->rbuff + bytes_read,
-                                            self->rbuff_len - bytes_read);
-        Py_END_ALLOW_THREADS
+            /* the buffer is empty, refill it */
+            chunk_len = MpRequest_FillBuffer(self);
 
-        if (chunk_len == -1) {
+            if (chunk_len == -1) {
+                Py_XDECREF(result);
+                return NULL;
+            }
 
-            /* Free rbuff since returning NULL here should end the request */
-            free(self->rbuff);
-            self->rbuff = NULL;
+            if (chunk_len == 0)
+                break;  /* end of input */
+        }
 
-            PyErr_SetObject(PyExc_IOError,
-                            PyString_FromString("Client read error (Timeout?)"));
-            return NULL;
+        start = self->rbuff + self->rbuff_pos;
+        avail = self->rbuff_len - self->rbuff_pos;
+        if (len > 0 && avail > len - copied)
+            avail = len - copied;
+
+        nl = memchr(start, '\n', avail);
+        n = nl ? (nl - start) + 1 : avail;
+
+        if (! result) {
+            /* the usual case, the whole line is in the buffer */
+            result = PyString_FromStringAndSize(start, n);
+            if (! result)
+                return NULL;
+        }
+        else {
+            /* a line spanning several blocks */
+            if (_PyString_Resize(&result, copied + n))
+                return NULL;
+            memcpy(PyString_AS_STRING(result) + copied, start, n);
         }
-        else
-            bytes_read += chunk_len;
-    }
-    self->rbuff_len = bytes_read;
-    self->rbuff_pos = 0;
 
-    /* now copy the remaining bytes */
-    while (self->rbuff_pos < self->rbuff_len) {
+        self->rbuff_pos += n;
+        copied += n;
 
-        buffer[copied++] = self->rbuff[self->rbuff_pos];
-        if ((self->rbuff[self->rbuff_pos++] == '\n') ||
-            (copied == len))
-            /* our work is done */
+        if (nl || copied == len)
             break;
     }
 
-    /* Free rbuff if we're done with it */
-    if (self->rbuff_pos >= self->rbuff_len && self->rbuff != NULL)
-    {
-        free(self->rbuff);
-        self->rbuff = NULL;
-    }
-
-    /* resize if necessary */
-    if (copied < len)
-        /* PYTHON 2.5: '_PyString_Resize' uses Py_ssize_t for input parameters */
-        if(_PyString_Resize(&result, copied))
-            return NULL;
+    if (! result)
+        result = PyString_FromString("");
 
     return result;
 }
 
+/**
+ ** request.readline(request self, int maxbytes)
+ **
+ *     Reads stuff like POST requests from the client
+ *     (based on the old net_read) until EOL
+ */
+
+static PyObject * req_readline(requestobject *self, PyObject *args)
+{
+    long len = -1;
+
+    if (! PyArg_ParseTuple(args, "|l", &len))
+        return NULL;
+
+    return read_line(self, len);
+}
+
 /**
  ** request.readlines([long maxsize])
  **
@@ -1256,7 +1448,7 @@ static PyObject *req_readlines(requestobject *self, PyObject *args)
 
     /* PYTHON 2.5: 'PyList_New' uses Py_ssize_t for input parameters */
     PyObject *result = PyList_New(0);
-    PyObject *line, *rlargs;
+    PyObject *line;
     long sizehint = -1;
     long size = 0;
     long linesize;
@@ -1267,12 +1459,7 @@ static PyObject *req_readlines(requestobject *self, PyObject *args)
     if (result == NULL)
         return PyErr_NoMemory();
 
-    /* PYTHON 2.5: 'PyTuple_New' uses Py_ssize_t for input parameters */
-    rlargs = PyTuple_New(0);
-    if (result == NULL)
-        return PyErr_NoMemory();
-
-    line = req_readline(self, rlargs);
+    line = read_line(self, -1);
     /* PYTHON 2.5: 'PyString_Size' uses Py_ssize_t for input parameters */
     while (line && ((linesize=PyString_Size(line))>0)) {
         PyList_Append(result, line);
@@ -1280,7 +1467,7 @@ static PyObject *req_readlines(requestobject *self, PyObject *args)
         if ((sizehint != -1) && (size >= sizehint))
             break;
         Py_DECREF(line);
-        line = req_readline(self, args);
+        line = read_line(self, -1);
     }
     Py_XDECREF(line);
 
@@ -1470,33 +1657,172 @@ static PyObject * req_update_mtime(requestobject *self, PyObject *args)
     return Py_None;
 }
 
+/**
+ ** write_buffer_init
+ **
+ *      Read the output buffer PythonOptions, allocate the buffer
+ *      if buffering is on.
+ */
+
+static void write_buffer_init(requestobject *self)
+{
+    py_config *conf =
+        (py_config *) ap_get_module_config(self->request_rec->per_dir_config,
+                                           &python_module);
+    const char *val;
+    long size;
+
+    self->wbuff_init = 1;
+
+    val = apr_table_get(conf->options, "mod_python.output_buffer.size");
+    if (val && (size = atol(val)) > 0) {
+        self->wbuff = apr_palloc(self->request_rec->pool, size);
+        self->wbuff_size = size;
+        self->wbuff_time = apr_time_now();
+
+        val = apr_table_get(conf->options, "mod_python.output_buffer.interval");
+        if (val)
+            self->wbuff_interval = (apr_interval_time_t)(atof(val) * APR_USEC_PER_SEC);
+    }
+}
+
+/**
+ ** MpRequest_FlushBuffer
+ **
+ *      Pass the contents of the output buffer on to the output
+ *      filters, then flush them if flush is true. Must be called
+ *      with the GIL held. Returns -1 if the client closed the
+ *      connection.
+ */
+
+int MpRequest_FlushBuffer(requestobject *self, int flush)
+{
+    int rc = 0;
+    apr_size_t len = self->wbuff_len;
+
+    if (!len && !flush)
+        return 0;
+
+    self->wbuff_len = 0;
+
+    Py_BEGIN_ALLOW_THREADS
+    if (len)
+        rc = ap_rwrite(self->wbuff, len, self->request_rec);
+    if (flush && (rc != -1))
+        rc = ap_rflush(self->request_rec);
+    Py_END_ALLOW_THREADS
+
+    if (flush)
+        self->wbuff_time = apr_time_now();
+
+    return rc == -1 ? -1 : 0;
+}
+
+/**
+ ** write_nocopy
+ **
+ *      Pass a string on to the output filters without copying it,
+ *      in a transient bucket. Filters that need to hold on to the
+ *      data after the call returns set it aside, all others (and
+ *      the network) use the string memory directly. Must be called
+ *      with the GIL held, and buff must stay valid until it returns.
+ *      Returns -1 if the client closed the connection.
+ */
+
+static int write_nocopy(requestobject *self, const char *buff,
+                        apr_size_t len, int flush)
+{
+    request_rec *r = self->request_rec;
+    conn_rec *c = r->connection;
+    apr_status_t rv;
+
+    if (c->aborted)
+        return -1;
+
+    if (!self->wbb)
+        self->wbb = apr_brigade_create(r->pool, c->bucket_alloc);
+
+    APR_BRIGADE_INSERT_TAIL(self->wbb,
+                            apr_bucket_transient_create(buff, len,
+                                                        c->bucket_alloc));
+    if (flush)
+        APR_BRIGADE_INSERT_TAIL(self->wbb,
+                                apr_bucket_flush_create(c->bucket_alloc));
+
+    Py_BEGIN_ALLOW_THREADS
+    rv = ap_pass_brigade(r->output_filters, self->wbb);
+    apr_brigade_cleanup(self->wbb);
+    Py_END_ALLOW_THREADS
+
+    return rv == APR_SUCCESS ? 0 : -1;
+}
+
 /**
  ** request.write(request self, string what, flush=1)
  **
  *      write output to the client
+ *
+ *      If the mod_python.output_buffer.size PythonOption is set,
+ *      small writes are collected in a buffer which is passed on
+ *      when it is full, when the buffer interval has elapsed, on
+ *      an explicit flush and at the end of every handler phase.
  */
 
 static PyObject * req_write(requestobject *self, PyObject *args)
 {
     int len;
-    int rc;
+    int rc = 0;
     char *buff;
-    int flush=1;
+    int flush=-1;
 
     if (! PyArg_ParseTuple(args, "s#|i", &buff, &len, &flush))
         return NULL;  /* bad args */
 
-    if (len > 0 ) {
+    if (! self->wbuff_init)
+        write_buffer_init(self);
+
+    if (self->wbuff_size) {
+
+        /* only an explicit flush=1 flushes a buffered request */
+
+        if (len > 0) {
+            if (self->wbuff_len + len > self->wbuff_size)
+                rc = MpRequest_FlushBuffer(self, 0);
+
+            if (rc != -1) {
+                if ((apr_size_t)len >= self->wbuff_size) {
+                    /* too big to be worth copying */
+                    rc = write_nocopy(self, buff, len, 0);
+                }
+                else {
+                    memcpy(self->wbuff + self->wbuff_len, buff, len);
+                    self->wbuff_len += len;
+                }
+            }
+        }
+
+        if ((rc != -1) &&
+            ((flush == 1) ||
+             (self->wbuff_interval &&
+              (apr_time_now() - self->wbuff_time >= self->wbuff_interval))))
+            rc = MpRequest_FlushBuffer(self, 1);
+    }
+    else if (len >= AP_MIN_BYTES_TO_WRITE) {
+
+        rc = write_nocopy(self, buff, len, flush);
+    }
+    else if (len > 0) {
 
         Py_BEGIN_ALLOW_THREADS
         rc = ap_rwrite(buff, len, self->request_rec);
         if (flush && (rc != -1))
             rc = ap_rflush(self->request_rec);
         Py_END_ALLOW_THREADS
-            if (rc == -1) {
-                PyErr_SetString(PyExc_IOError, "Write failed, client closed connection.");
-                return NULL;
-            }
+    }
+
+    if (rc == -1) {
+        PyErr_SetString(PyExc_IOError, "Write failed, client closed connection.");
+        return NULL;
     }
 
     self->bytes_queued += len;
@@ -1516,9 +1842,13 @@ static PyObject * req_flush(requestobject *self)
 {
     int rc;
 
-    Py_BEGIN_ALLOW_THREADS
-    rc = ap_rflush(self->request_rec);
-    Py_END_ALLOW_THREADS
+    if (self->wbuff_size)
+        rc = MpRequest_FlushBuffer(self, 1);
+    else {
+        Py_BEGIN_ALLOW_THREADS
+        rc = ap_rflush(self->request_rec);
+        Py_END_ALLOW_THREADS
+    }
     if (rc == -1) {
         PyErr_SetString(PyExc_IOError, "Flush failed, client closed connection.");
         return NULL;
@@ -1566,6 +1896,12 @@ static PyObject * req_sendfile(requestobject *self, PyObject *args)
 
     if (len==-1) len=finfo.size;
 
+    if (MpRequest_FlushBuffer(self, 0) == -1) {
+        apr_file_close(fd);
+        PyErr_SetString(PyExc_IOError, "Write failed, client closed connection.");
+        return NULL;
+    }
+
     Py_BEGIN_ALLOW_THREADS
         status = ap_send_fd(fd, self->request_rec, offset,
                             len, &nbytes);
@@ -1606,9 +1942,11 @@ static PyMethodDef request_methods[] = {
     {"get_options",           (PyCFunction) req_get_options,           METH_NOARGS},
     {"internal_redirect",     (PyCFunction) req_internal_redirect,     METH_VARARGS},
     {"is_https",              (PyCFunction) req_is_https,              METH_NOARGS},
+    {"iter_body",             (PyCFunction) req_iter_body,             METH_VARARGS},
     {"log_error",             (PyCFunction) req_log_error,             METH_VARARGS},
     {"meets_conditions",      (PyCFunction) req_meets_conditions,      METH_NOARGS},
     {"read",                  (PyCFunction) req_read,                  METH_VARARGS},
+    {"readinto",              (PyCFunction) req_readinto,              METH_VARARGS},
     {"readline",              (PyCFunction) req_readline,              METH_VARARGS},
     {"readlines",             (PyCFunction) req_readlines,             METH_VARARGS},
     {"register_cleanup",      (PyCFunction) req_register_cleanup,      METH_VARARGS},
@@ -1934,6 +2272,13 @@ static PyObject *getreq_recmbr_off(requestobject *self, void *name)
 {
     PyMemberDef *md = find_memberdef(request_rec_mbrs, name);
     char *addr = (char *)self->request_rec + md->offset;
+
+    /* what remains of a chunked body is not known */
+    if (self->request_rec->read_chunked && strcmp(name, "remaining") == 0) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
     if (sizeof(apr_off_t) == sizeof(LONG_LONG)) {
         LONG_LONG l = *(LONG_LONG*)addr;
         return PyLong_FromLongLong(l);
@@ -2184,9 +2529,8 @@ static void request_tp_dealloc(requestobject *self)
      */
     PyObject_GC_UnTrack(self);
 
-    /* self->rebuff is used by req_readline.
-     * It may not have been freed if req_readline was not
-     * enough times to consume rbuff's contents.
+    /* self->rbuff is the read buffer of req_readline,
+     * it is kept for the life of the request object.
      */
     if (self->rbuff != NULL)
         free(self->rbuff);
@@ -2225,6 +2569,26 @@ static int request_tp_traverse(requestobject* self, visitproc visit, void *arg)
     /* no need to Py_DECREF(dict) since the reference is borrowed */
     return 0;
 }
+/**
+ ** request_tp_iternext
+ **
+ *    Iterating over the request object yields the lines of the
+ *    request body, i.e. for line in req: ...
+ */
+
+static PyObject *request_tp_iternext(requestobject *self)
+{
+    PyObject *line = read_line(self, -1);
+
+    if (line && PyString_GET_SIZE(line) == 0) {
+        /* end of input, raises StopIteration */
+        Py_DECREF(line);
+        return NULL;
+    }
+
+    return line;
+}
+
 static char request_doc[] =
 "Apache request_rec structure\n";
 
@@ -2258,8 +2622,8 @@ PyTypeObject MpRequest_Type = {
     (inquiry)request_tp_clear,         /* tp_clear */
     0,                                 /* tp_richcompare */
     0,                                 /* tp_weaklistoffset */
-    0,                                 /* tp_iter */
-    0,                                 /* tp_iternext */
+    PyObject_SelfIter,                 /* tp_iter */
+    (iternextfunc)request_tp_iternext, /* tp_iternext */
     request_methods,                   /* tp_methods */
     request_members,                   /* tp_members */
     request_getsets,                   /* tp_getset */
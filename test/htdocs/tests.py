@@ -789,6 +789,27 @@ def req_read(req):
 
     return apache.OK
 
+def req_readinto(req):
+
+    buf = bytearray(1000)
+    view = memoryview(buf)
+    n = req.readinto(buf)
+    while n:
+        req.write(view[:n].tobytes())
+        n = req.readinto(view)
+
+    return apache.OK
+
+def req_iter_body(req):
+
+    for chunk in req.iter_body(1000):
+        if len(chunk) > 1000:
+            req.write("chunk too big")
+            break
+        req.write(chunk)
+
+    return apache.OK
+
 def req_readline(req):
 
     s = req.readline()
@@ -798,6 +819,13 @@ def req_readline(req):
 
     return apache.OK
 
+def req_iterate(req):
+
+    for line in req:
+        req.write("%d:%s" % (len(line), line))
+
+    return apache.OK
+
 def req_readlines(req):
 
     
@@ -906,6 +934,17 @@ def req_sendfile3(req):
     os.remove(fname)
     return apache.OK
 
+def req_write_buffer(req):
+
+    # small writes are buffered, a write larger than the
+    # buffer goes out after what has been buffered so far
+    req.write("t")
+    req.write("e" * 100)
+    for c in "st ok":
+        req.write(c)
+
+    return apache.OK
+
 def req_handler(req):
     if req.phase == "PythonFixupHandler":
         req.handler = "mod_python"
@@ -1019,6 +1058,105 @@ def util_fieldstorage(req):
     req.write(`util.FieldStorage(req).list`)
     return apache.OK
 
+def util_fieldstorage_chunked(req):
+
+    from mod_python import util
+    fs = util.FieldStorage(req)
+    req.write("%s %s" % (req.remaining, `fs.list`))
+    return apache.OK
+
+def util_fieldstorage_mapping(req):
+
+    from mod_python import util
+    fs = util.FieldStorage(req)
+    result = [fs["spam"]]
+    fs.add_field("spam", "5")
+    result.append(fs.getlist("spam"))
+    fs["spam"] = "6"
+    result.append(fs["spam"])
+    del fs["eggs"]
+    result.append(fs.getfirst("eggs"))
+    result.append(fs.get("bacon", None))
+    result.append(sorted(fs.keys()))
+    result.append(fs.list)
+    req.write(" ".join(map(str, result)))
+    return apache.OK
+
+def util_fieldstorage_lazy(req):
+
+    from mod_python import util
+    fs = util.FieldStorage(req, lazy=1)
+    # bacon and spam are in the query string, the body is not read
+    bacon, spam = fs["bacon"], fs["spam"]
+    req.write("%s %d %s " % (bacon, req.read_length, spam))
+    req.write("%s %s" % (fs.getfirst("eggs"), `fs.list`))
+    return apache.OK
+
+def util_apply_fs_data(req):
+
+    from mod_python import util
+
+    def call(object):
+        fs = util.FieldStorage(req)
+        return util.apply_fs_data(object, fs, req=req)
+
+    def func(req, a, b=None):
+        return "func %s %s" % (a, b)
+
+    def other(req, c, a="x"):
+        return "other %s %s" % (c, a)
+
+    def kw(req, **kw):
+        keys = kw.keys()
+        keys.sort()
+        return "kw %s %s" % (hasattr(req, "uri"), " ".join(keys))
+
+    class Callable:
+        def method(self, a):
+            return "method %s" % a
+        def __call__(self, c):
+            return "call %s" % c
+
+    result = [call(func), call(func), call(kw), call(kw),
+              call(Callable().method), call(Callable())]
+
+    # the code of a function changes when it is reloaded,
+    # and its defaults can be changed at any time
+    func.func_code = other.func_code
+    func.func_defaults = ("y",)
+    result.append(call(func))
+
+    req.write("\n".join(result))
+    return apache.OK
+
+def util_fieldstorage_spool(req):
+
+    from mod_python import util
+    fs = util.FieldStorage(req)
+    for field in fs.list:
+        if field.filename:
+            req.write("%s %d %s " % (field.name, len(field.value),
+                                     field.file.rolled()))
+    return apache.OK
+
+def util_fieldstorage_upload(req):
+
+    from mod_python import util
+    fs = util.FieldStorage(req)
+    req.write("%s %d" % (fs["field"], len(fs["file"].value)))
+    return apache.OK
+
+def util_fieldstorage_upload_lines(req):
+
+    from mod_python import util
+
+    class LineFieldStorage(util.FieldStorage):
+        read_to_boundary = util.FieldStorage._read_to_boundary
+
+    fs = LineFieldStorage(req)
+    req.write("%s %d" % (fs["field"], len(fs["file"].value)))
+    return apache.OK
+
 def postreadrequest(req):
 
     req.log_error('postreadrequest')
@@ -1068,6 +1206,68 @@ def import_test(req):
 
     return apache.OK
 
+def import_module_threads(req):
+
+    import tempfile, shutil, threading
+
+    dir = tempfile.mkdtemp()
+    name = "mp_slow_module"
+    f = open(os.path.join(dir, name + ".py"), "w")
+    f.write("import time\ntime.sleep(0.5)\nvalue = 'done'\n")
+    f.close()
+
+    f = open(os.path.join(dir, "mp_other_module.py"), "w")
+    f.write("value = 'other'\n")
+    f.close()
+
+    results = []
+    def import_it(name=name):
+        try:
+            module = apache.import_module(name, autoreload=0, path=[dir])
+            results.append(module.__dict__.get("value"))
+        except:
+            results.append(repr(sys.exc_info()[1]))
+
+    try:
+        # the lock of one module does not keep others from
+        # being imported
+        lock = apache._acquire_import_lock(name)
+        try:
+            thread = threading.Thread(target=import_it,
+                                      args=("mp_other_module",))
+            thread.start()
+            thread.join(10)
+        finally:
+            lock.release()
+        if results != ["other"]:
+            req.write("blocked by the lock of another module: %s" % results)
+            return apache.OK
+        del results[:]
+
+        waits = apache.import_lock_waits()
+
+        # the second thread finds the module in sys.modules while
+        # the first one is still running its code
+        threads = [threading.Thread(target=import_it) for i in range(2)]
+        threads[0].start()
+        time.sleep(0.1)
+        threads[1].start()
+        for thread in threads:
+            thread.join(10)
+
+        if results != ["done", "done"]:
+            req.write("partial import: %s" % results)
+        elif apache.import_lock_waits() <= waits:
+            req.write("no wait counted")
+        else:
+            req.write("test ok")
+    finally:
+        sys.modules.pop(name, None)
+        sys.modules.pop("mp_other_module", None)
+        shutil.rmtree(dir)
+
+    return apache.OK
+
 def outputfilter(filter):
 
     s = filter.read()
@@ -1269,10 +1469,203 @@ def PythonOption_items(req):
     req.write(str(options))
     return apache.OK
 
+def psp_cache_stats(req):
+
+    from mod_python import psp
+
+    before = psp.mem_scache.stats()
+    for i in range(2):
+        psp.PSP(req, string="<% x = 1 %>").run()
+    after = psp.mem_scache.stats()
+
+    # compiled once at most, then a hit
+    if after["hits"] < before["hits"] + 1:
+        req.write("no hit: %s %s" % (before, after))
+    elif after["compiles"] > before["compiles"] + 1:
+        req.write("compiled twice: %s %s" % (before, after))
+    elif not after["entries"] or not after["bytes"]:
+        req.write("not cached: %s" % after)
+    else:
+        req.write("test ok")
+
+    return apache.OK
+
+def psp_globals(req):
+
+    from mod_python import psp
+
+    # module globals reached without naming them in the code
+    psp.PSP(req, string='<%= eval("escape")("<") %> '
+                        '<%= globals().has_key("apache") %>').run()
+    return apache.OK
+
+def psp_compiled(req):
+
+    from mod_python import psp
+    import types
+
+    # the templates in this directory have been precompiled by
+    # test.py with the compile-psp command of the mod_python script
+    dir = req.get_options()["psp_compiled_dir"]
+    names = [name for name in os.listdir(dir) if name.endswith(".psp")]
+    names.sort()
+    for name in names:
+        f = open(os.path.join(dir, name[:-1] + "c"), "rb")
+        try:
+            code = psp.str2code(f.read())
+        finally:
+            f.close()
+        if type(code) is not types.CodeType:
+            req.write("%s: %r" % (name, code))
+            return apache.OK
+
+    req.write(" ".join(names))
+    return apache.OK
+
+def psp_cache_lru(req):
+
+    from mod_python import psp
+    import marshal
+
+    codes = {}
+    for name in "abcd":
+        codes[name] = compile("x = %r" % (name * 100), name, "exec")
+    size = len(marshal.dumps(codes["a"]))
+
+    def keys(cache):
+        keys = cache.cache.keys()
+        keys.sort()
+        return "".join(keys)
+
+    # at most two entries, the least recently used one goes
+    cache = psp.HitsCache(size=2)
+    cache.store("a", codes["a"])
+    cache.store("b", codes["b"])
+    cache.get("a")
+    cache.store("c", codes["c"])
+    if keys(cache) != "ac" or cache.stats()["evictions"] != 1:
+        req.write("size: %s %s" % (keys(cache), cache.stats()))
+        return apache.OK
+
+    # at most three entries' worth of bytes
+    cache = psp.HitsCache(size=10, max_bytes=size * 3)
+    for name in "abcd":
+        cache.store(name, codes[name])
+    cache.get("b")
+    cache.store("a", codes["a"])
+    stats = cache.stats()
+    if (keys(cache) != "abd" or stats["bytes"] != size * 3 or
+        stats["evictions"] != 2):
+        req.write("max_bytes: %s %s" % (keys(cache), stats))
+        return apache.OK
+
+    # lower limits apply at once
+    cache.set_limits(max_bytes=size * 2)
+    if keys(cache) != "ab":
+        req.write("max_bytes lowered: %s" % keys(cache))
+        return apache.OK
+    cache.set_limits(size=1)
+    if keys(cache) != "a":
+        req.write("size lowered: %s" % keys(cache))
+        return apache.OK
+
+    # a file cached with another mtime is dropped
+    cache = psp.FileCache(size=2)
+    cache.store("a", 1, codes["a"])
+    if cache.get("a", 2) is not None or cache.cache or cache.stats()["bytes"]:
+        req.write("mtime: %s" % cache.stats())
+        return apache.OK
+
+    req.write("test ok")
+    return apache.OK
+
 def interpreter(req):
     req.write(req.interpreter)
     return apache.DONE
 
+def dispatch_plan(req):
+
+    # the directory was added back to sys.path before dispatching
+    directory = req.hlist.directory
+    in_path = directory in sys.path
+    sys.path[:] = [p for p in sys.path if p != directory]
+
+    plans = [(plan.autoreload, id(plan))
+             for key, plan in apache._plan_cache.items()
+             if key[0] == "tests::dispatch_plan"]
+    plans.sort()
+    req.write("%s %s" % (in_path, " ".join(["%d:%x" % p for p in plans])))
+
+    return apache.OK
+
+def file_watcher(req):
+
+    from mod_python import watcher
+    import tempfile, shutil
+
+    def wait(cond):
+        end = time.time() + 5
+        while not cond() and time.time() < end:
+            time.sleep(0.05)
+        return cond()
+
+    def check(use_inotify):
+        dir = tempfile.mkdtemp()
+        w = watcher.FileWatcher(0.05, use_inotify, max_files=2, max_missing=2)
+        w.start()
+        try:
+            path = os.path.join(dir, "a.py")
+            open(path, "w").write("a = 1\n")
+            mtime = w.mtime(path)
+            if mtime != os.stat(path).st_mtime:
+                return "wrong mtime %s" % mtime
+
+            # change detection
+            os.utime(path, (mtime + 10, mtime + 10))
+            if not wait(lambda: w.mtime(path) == os.stat(path).st_mtime != mtime):
+                return "change not seen"
+
+            # deletion
+            os.unlink(path)
+            if not wait(lambda: w.mtime(path) is None):
+                return "deletion not seen"
+            if path in w._mtimes:
+                return "deleted file still tracked"
+
+            # and creation
+            open(path, "w").write("a = 2\n")
+            if not wait(lambda: w.mtime(path) is not None):
+                return "creation not seen"
+
+            # paths that do not exist are only remembered up to a limit
+            for i in range(10):
+                w.mtime(os.path.join(dir, "missing%d.py" % i))
+            if len(w._missing) > 2:
+                return "missing paths not bounded: %s" % len(w._missing)
+
+            # as are the files tracked
+            for i in range(5):
+                name = os.path.join(dir, "b%d.py" % i)
+                open(name, "w").write("b = 1\n")
+                if w.mtime(name) is None:
+                    return "mtime of untracked file not found"
+            if len(w._mtimes) > 2:
+                return "files not bounded: %s" % len(w._mtimes)
+            if len(w._polled) > 4:
+                return "polled paths not bounded: %s" % len(w._polled)
+        finally:
+            w.stop()
+            shutil.rmtree(dir)
+
+    for use_inotify in (False, True):
+        result = check(use_inotify)
+        if result:
+            req.write("%s (inotify %s)" % (result, use_inotify))
+            return apache.OK
+
+    req.write("test ok")
+    return apache.OK
+
 def index(req):
     return "test ok, interpreter=%s" % req.interpreter
 
@@ -1306,6 +1699,18 @@ class _test_publisher_auth_method_nested:
 
 test_publisher_auth_method_nested = _test_publisher_auth_method_nested()
 
+auth_cache_calls = 0
+
+def test_publisher_auth_cache(req):
+    def __auth__(req, user, password):
+        global auth_cache_calls
+        auth_cache_calls += 1
+        return user == "spam" and password == "eggs"
+    return str(auth_cache_calls)
+
+def test_publisher_form(req, spam):
+    return "%s %s" % (type(spam).__name__, " ".join(list(spam)))
+
 class OldStyleClassTest:
     def __init__(self):
         pass
@@ -1327,6 +1732,20 @@ def test_generator(req):
         yield c
         c += 1
 
+def test_publisher_flush(req):
+    flushes = []
+    flush = req.flush
+    def counting_flush():
+        flushes.append(1)
+        flush()
+    req.flush = counting_flush
+    def generator():
+        yield "aaa"
+        # counts towards flush_size with what came before
+        yield iter(["bb"])
+        yield " %d" % len(flushes)
+    return generator()
+
 def server_side_include(req):
     req.ssi_globals = { "data": "test" }
     return apache.OK
@@ -1526,6 +1945,9 @@ def okay(req):
     req.write("test ok")
     return apache.OK
 
+def noop(req):
+    return apache.OK
+
 def memory(req):
 
     # NB: This only works on Linux.
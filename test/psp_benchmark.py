@@ -0,0 +1,115 @@
+ #
+ # Copyright (C) 2000, 2001, 2013 Gregory Trubetskoy
+ # Copyright (C) 2002, 2003, 2004, 2005, 2006, 2007 Apache Software Foundation
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License"); you
+ # may not use this file except in compliance with the License.  You
+ # may obtain a copy of the License at
+ #
+ #      http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+ # implied.  See the License for the specific language governing
+ # permissions and limitations under the License.
+ #
+ #
+
+"""
+
+  Time the PSP parser and the code it generates.
+
+  Usage: python psp_benchmark.py [-n NUMBER] [template ...]
+
+  For every template (the PSP templates of the test suite by
+  default), prints how long parsing it and compiling the result
+  takes, how long running the code takes and how many calls to
+  req.write() it makes. Templates are run outside of Apache against a
+  request object which only collects what is written, so those that
+  need more than req, form, psp or session report the error instead.
+  Only needs the mod_python _psp extension, not a running server.
+
+"""
+
+import sys
+import os
+import glob
+import time
+import getopt
+
+from mod_python import _psp
+
+class Request:
+
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data, flush=1):
+        self.writes += 1
+
+class PSPInterface:
+
+    def set_error_page(self, page):
+        pass
+
+def best(func, number):
+    """ Return the shortest time in seconds func took of number calls. """
+
+    times = []
+    for i in range(number):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+def benchmark(filename, number):
+
+    dir, fname = os.path.split(os.path.abspath(filename))
+    dir += os.sep
+
+    parse_time = best(lambda: _psp.parse(fname, dir), number)
+    source = _psp.parse(fname, dir)
+    compile_time = best(lambda: compile(source, filename, "exec"), number)
+    code = compile(source, filename, "exec")
+
+    req = Request()
+    def run():
+        req.writes = 0
+        exec code in {"req": req, "form": None, "psp": PSPInterface(),
+                      "session": {}}
+
+    try:
+        run()
+    except:
+        et, ev = sys.exc_info()[:2]
+        return parse_time, compile_time, None, "%s: %s" % (et.__name__, ev)
+
+    return parse_time, compile_time, best(run, number), req.writes
+
+def main(argv):
+
+    opts, templates = getopt.getopt(argv, "n:")
+    number = int(dict(opts).get("-n", 1000))
+
+    if not templates:
+        htdocs = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "htdocs")
+        templates = glob.glob(os.path.join(htdocs, "*.psp"))
+        templates.sort()
+
+    print "%-24s %10s %10s %10s %7s" % ("template", "parse ms",
+                                         "compile ms", "run us", "writes")
+    for filename in templates:
+        parse_time, compile_time, run_time, writes = benchmark(filename, number)
+        name = os.path.basename(filename)
+        if run_time is None:
+            print "%-24s %10.3f %10.3f %10s %s" % (name, parse_time * 1e3,
+                                                   compile_time * 1e3, "-", writes)
+        else:
+            print "%-24s %10.3f %10.3f %10.1f %7d" % (name, parse_time * 1e3,
+                                                      compile_time * 1e3,
+                                                      run_time * 1e6, writes)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -210,6 +210,25 @@ def get_ab_path():
 
     return None
 
+def ab_time_per_request(path, n=2000, c=10, postfile=None, ctype=None):
+    """ Run ab against path on the test server, return the mean
+        time per request in milliseconds, or None if there is no ab.
+        If postfile is given, its contents are POSTed with ctype. """
+    ab = get_ab_path()
+    if not ab:
+        return None
+
+    post = ""
+    if postfile:
+        post = "-p %s -T '%s' " % (quote_if_space(postfile), ctype)
+    cmd = '%s -n %d -c %d %shttp://127.0.0.1:%s%s' % (ab, n, c, post, PORT, path)
+    print "    ", cmd
+    for line in os.popen(cmd).readlines():
+        if line.startswith("Time per request:") and "(mean)" in line:
+            return float(line.split()[3])
+
+    return None
+
 def get_apache_version():
 
     print "Checking Apache version...."
@@ -929,6 +948,64 @@ class PerRequestTestCase(unittest.TestCase):
             self.fail("timeout test failed")
 
 
+    def test_req_readinto_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_req_readinto"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::req_readinto"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_req_readinto(self):
+
+        print "\n  * Testing req.readinto()"
+
+        params = '1234567890'*10000
+        conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+        conn.putrequest("POST", "/tests.py", skip_host=1)
+        conn.putheader("Host", "test_req_readinto:%s" % PORT)
+        conn.putheader("Content-Length", str(len(params)))
+        conn.endheaders()
+        conn.send(params)
+        response = conn.getresponse()
+        rsp = response.read()
+        conn.close()
+
+        if (rsp != params):
+            self.fail(`rsp`)
+
+    def test_req_iter_body_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_req_iter_body"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::req_iter_body"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_req_iter_body(self):
+
+        print "\n  * Testing req.iter_body()"
+
+        params = '1234567890'*10000
+        conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+        conn.putrequest("POST", "/tests.py", skip_host=1)
+        conn.putheader("Host", "test_req_iter_body:%s" % PORT)
+        conn.putheader("Content-Length", str(len(params)))
+        conn.endheaders()
+        conn.send(params)
+        response = conn.getresponse()
+        rsp = response.read()
+        conn.close()
+
+        if (rsp != params):
+            self.fail(`rsp`)
+
     def test_req_readline_conf(self):
 
         c = VirtualHost("*",
@@ -960,6 +1037,38 @@ class PerRequestTestCase(unittest.TestCase):
         if (rsp != params):
             self.fail(`rsp`)
 
+    def test_req_iterate_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_req_iterate"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::req_iterate"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_req_iterate(self):
+
+        print "\n  * Testing iteration over the request body"
+
+        # lines longer than the read buffer, empty lines and
+        # no newline at the end
+        params = ('1234567890'*10000+'\n')*2 + '\n' + 'a\n'*1000 + 'end'
+        conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+        conn.putrequest("POST", "/tests.py", skip_host=1)
+        conn.putheader("Host", "test_req_iterate:%s" % PORT)
+        conn.putheader("Content-Length", str(len(params)))
+        conn.endheaders()
+        conn.send(params)
+        response = conn.getresponse()
+        rsp = response.read()
+        conn.close()
+
+        expected = "".join(["%d:%s" % (len(l), l) for l in params.splitlines(True)])
+        if (rsp != expected):
+            self.fail(`rsp[:100]`)
+
     def test_req_readlines_conf(self):
 
         c = VirtualHost("*",
@@ -1182,6 +1291,38 @@ class PerRequestTestCase(unittest.TestCase):
         else:
             print "\n  * Skipping req.sendfile() for a file which is a symbolic link"
 
+    def test_req_write_buffer_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_req_write_buffer"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::req_write_buffer"),
+                                  PythonOption("mod_python.output_buffer.size 64"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_req_write_buffer(self):
+
+        print "\n  * Testing req.write() with mod_python.output_buffer.size"
+
+        conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+        conn.putrequest("GET", "/test.py", skip_host=1)
+        conn.putheader("Host", "test_req_write_buffer:%s" % PORT)
+        conn.endheaders()
+        response = conn.getresponse()
+        clength = response.getheader("content-length", None)
+        rsp = response.read()
+        conn.close()
+
+        expected = "t" + "e" * 100 + "st ok"
+        if rsp != expected:
+            self.fail(`rsp`)
+
+        if clength != str(len(expected)):
+            self.fail("Content-Length is %s, expected %d" % (`clength`, len(expected)))
+
     def test_req_handler_conf(self):
 
         c = VirtualHost("*",
@@ -1675,6 +1816,62 @@ class PerRequestTestCase(unittest.TestCase):
         if (rsp != interpreter_name+'SUBDIR/'):
             self.fail(`rsp`)
 
+    def test_dispatch_plan_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_dispatch_plan"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::dispatch_plan"),
+                                  PythonDebug("On")),
+                        Directory(DOCUMENT_ROOT+"/subdir",
+                                  PythonAutoReload("Off")))
+        return c
+
+    def test_dispatch_plan(self):
+
+        print "\n  * Testing reuse and invalidation of dispatch plans"
+
+        # the same plan is reused
+        rsp = self.vhost_get("test_dispatch_plan")
+        if (len(rsp.split()) != 2 or rsp.split()[0] != "True"):
+            self.fail(`rsp`)
+        first = rsp.split()[1]
+        if not first.startswith("1:"):
+            self.fail(`rsp`)
+
+        # and adds its directory back after it was removed from sys.path
+        rsp = self.vhost_get("test_dispatch_plan")
+        if (rsp != "True " + first):
+            self.fail(`rsp`)
+
+        # a different configuration results in a new plan
+        rsp = self.vhost_get("test_dispatch_plan", "/subdir/foo.py")
+        words = rsp.split()
+        if (len(words) != 3 or words[0] != "True" or
+            not words[1].startswith("0:") or words[2] != first):
+            self.fail(`rsp`)
+
+    def test_watcher_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_watcher"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::file_watcher"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_watcher(self):
+
+        print "\n  * Testing mod_python.watcher"
+
+        rsp = self.vhost_get("test_watcher")
+        if (rsp != "test ok"):
+            self.fail(`rsp`)
+
     def test_util_fieldstorage_conf(self):
 
         c = VirtualHost("*",
@@ -1704,6 +1901,233 @@ class PerRequestTestCase(unittest.TestCase):
         if (rsp != "[Field('spam', '1'), Field('spam', '2'), Field('eggs', '3'), Field('bacon', '4')]"):
             self.fail(`rsp`)
 
+    def test_util_fieldstorage_boundary(self):
+
+        print "\n  * Testing util_fieldstorage() with unusual multipart boundaries"
+
+        # parsed line by line, the C parser does not take these
+        for boundary in ("", "b" * 250):
+            body = ("--%s\r\n"
+                    "Content-Disposition: form-data; name=\"spam\"\r\n\r\n"
+                    "1\r\n"
+                    "--%s--\r\n") % (boundary, boundary)
+            headers = {"Host": "test_util_fieldstorage",
+                       "Content-type": "multipart/form-data; boundary=%s" % boundary}
+            conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+            conn.request("POST", "/tests.py", body, headers)
+            response = conn.getresponse()
+            rsp = response.read()
+            conn.close()
+
+            if (rsp != "[Field('spam', '1')]"):
+                self.fail(`rsp`)
+
+    def test_util_fieldstorage_chunked_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_util_fieldstorage_chunked"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::util_fieldstorage_chunked"),
+                                  PythonOption("mod_python.request_body.chunked dechunk"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_util_fieldstorage_chunked(self):
+
+        print "\n  * Testing util_fieldstorage() with a chunked request body"
+
+        from urllib import urlencode
+        params = urlencode([('spam', 1), ('spam', 2), ('eggs', 3), ('bacon', 4)])
+        conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+        conn.putrequest("POST", "/tests.py", skip_host=1)
+        conn.putheader("Host", "test_util_fieldstorage_chunked:%s" % PORT)
+        conn.putheader("Content-type", "application/x-www-form-urlencoded")
+        conn.putheader("Transfer-Encoding", "chunked")
+        conn.endheaders()
+        for i in range(0, len(params), 10):
+            chunk = params[i:i+10]
+            conn.send("%x\r\n%s\r\n" % (len(chunk), chunk))
+        conn.send("0\r\n\r\n")
+        response = conn.getresponse()
+        rsp = response.read()
+        conn.close()
+
+        if (rsp != "None [Field('spam', '1'), Field('spam', '2'), Field('eggs', '3'), Field('bacon', '4')]"):
+            self.fail(`rsp`)
+
+    def test_util_fieldstorage_mapping_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_util_fieldstorage_mapping"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::util_fieldstorage_mapping"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_util_fieldstorage_mapping(self):
+
+        print "\n  * Testing util_fieldstorage() mapping methods"
+
+        rsp = self.vhost_get("test_util_fieldstorage_mapping",
+                             "/tests.py?spam=1&eggs=2&spam=3&bacon=4")
+
+        if (rsp != "[Field('spam', '1'), Field('spam', '3')] [Field('spam', '1'), Field('spam', '3'), Field('spam', '5')] 6 None 4 ['bacon', 'spam'] [Field('bacon', '4'), Field('spam', '6')]"):
+            self.fail(`rsp`)
+
+    def test_util_fieldstorage_lazy_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_util_fieldstorage_lazy"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::util_fieldstorage_lazy"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_util_fieldstorage_lazy(self):
+
+        print "\n  * Testing util_fieldstorage() in lazy mode"
+
+        from urllib import urlencode
+        params = urlencode([('spam', 1), ('eggs', 2), ('spam', 3)])
+        headers = {"Host": "test_util_fieldstorage_lazy",
+                   "Content-type": "application/x-www-form-urlencoded",
+                   "Accept": "text/plain"}
+        conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+        conn.request("POST", "/tests.py?bacon=4&spam=5", params, headers)
+        response = conn.getresponse()
+        rsp = response.read()
+        conn.close()
+
+        if (rsp != "4 0 5 2 [Field('bacon', '4'), Field('spam', '5'), Field('spam', '1'), Field('eggs', '2'), Field('spam', '3')]"):
+            self.fail(`rsp`)
+
+    def test_util_apply_fs_data_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_util_apply_fs_data"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::util_apply_fs_data"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_util_apply_fs_data(self):
+
+        print "\n  * Testing util.apply_fs_data()"
+
+        rsp = self.vhost_get("test_util_apply_fs_data",
+                             "/tests.py?a=1&b=2&b=3&c=4&req=5")
+        expected = ["func 1 ['2', '3']",
+                    "func 1 ['2', '3']",
+                    "kw True a b c",
+                    "kw True a b c",
+                    "method 1",
+                    "call 4",
+                    "other 4 1"]
+        if (rsp.split("\n") != expected):
+            self.fail(`rsp`)
+
+    def test_util_fieldstorage_limits_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_util_fieldstorage_limits"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::util_fieldstorage"),
+                                  PythonOption("mod_python.form.max_fields 3"),
+                                  PythonOption("mod_python.form.max_field_size 10"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_util_fieldstorage_limits(self):
+
+        print "\n  * Testing util_fieldstorage() limits on URL encoded bodies"
+
+        def post(params):
+            headers = {"Host": "test_util_fieldstorage_limits",
+                       "Content-type": "application/x-www-form-urlencoded"}
+            conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+            conn.request("POST", "/tests.py", params, headers)
+            response = conn.getresponse()
+            rsp = response.status, response.read()
+            conn.close()
+            return rsp
+
+        rsp = post("spam=1&eggs=22&bacon=1234")
+        if rsp != (200, "[Field('spam', '1'), Field('eggs', '22'), Field('bacon', '1234')]"):
+            self.fail(`rsp`)
+
+        # too many fields
+        rsp = post("spam=1&eggs=22&bacon=1234&ham=4")
+        if rsp[0] != 413:
+            self.fail(`rsp`)
+
+        # a field too large
+        rsp = post("spam=1&bacon=12345")
+        if rsp[0] != 413:
+            self.fail(`rsp`)
+
+    def test_util_fieldstorage_spool_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_util_fieldstorage_spool"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::util_fieldstorage_spool"),
+                                  PythonOption("mod_python.form.spool_threshold 1000"),
+                                  PythonOption("mod_python.form.memory_limit 3000"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_util_fieldstorage_spool(self):
+
+        print "\n  * Testing util_fieldstorage() spooling to disk"
+
+        def post(parts):
+            boundary = "----------ThIs_Is_tHe_bouNdaRY_$"
+            body = ""
+            for name, filename, value in parts:
+                body += "--%s\r\nContent-Disposition: form-data; name=\"%s\"" % (boundary, name)
+                if filename:
+                    body += "; filename=\"%s\"" % filename
+                body += "\r\n\r\n%s\r\n" % value
+            body += "--%s--\r\n" % boundary
+            headers = {"Host": "test_util_fieldstorage_spool",
+                       "Content-type": "multipart/form-data; boundary=%s" % boundary}
+            conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+            conn.request("POST", "/tests.py", body, headers)
+            response = conn.getresponse()
+            rsp = response.status, response.read()
+            conn.close()
+            return rsp
+
+        # a small file stays in memory, a large one is spooled
+        rsp = post([("small", "small.txt", "a" * 100),
+                    ("large", "large.txt", "b" * 2000)])
+        if rsp != (200, "small 100 False large 2000 True "):
+            self.fail(`rsp`)
+
+        # once 3000 bytes are kept in memory, files are spooled early
+        rsp = post([("field", None, "c" * 2500),
+                    ("small", "small.txt", "a" * 600)])
+        if rsp != (200, "small 600 True "):
+            self.fail(`rsp`)
+
+        # and fields are refused
+        rsp = post([("field", None, "c" * 2500),
+                    ("field2", None, "d" * 600)])
+        if rsp[0] != 413:
+            self.fail(`rsp`)
+
     def test_postreadrequest_conf(self):
 
         c = VirtualHost("*",
@@ -1765,6 +2189,25 @@ class PerRequestTestCase(unittest.TestCase):
         if (rsp != "test ok"):
             self.fail(`rsp`)
 
+    def test_import_module_threads_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_import_module_threads"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::import_module_threads"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_import_module_threads(self):
+
+        print "\n  * Testing apache.import_module() from concurrent threads"
+
+        rsp = self.vhost_get("test_import_module_threads")
+        if (rsp != "test ok"):
+            self.fail(`rsp`)
+
     def test_outputfilter_conf(self):
 
         c = VirtualHost("*",
@@ -1987,6 +2430,36 @@ class PerRequestTestCase(unittest.TestCase):
         if (rsp[-8:] != "test ok\n"):
             self.fail(`rsp`)
 
+    def test_psp_cache_dir_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_psp_cache_dir"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("mod_python.psp"),
+                                  PythonOption("mod_python.psp.cache_dir %s" % TMP_DIR),
+                                  PythonDebug("On")))
+        return c
+
+    def test_psp_cache_dir(self):
+
+        print "\n  * Testing mod_python.psp cache directory"
+
+        import md5
+        page = os.path.join(DOCUMENT_ROOT, "psptest.psp")
+        cached = os.path.join(TMP_DIR, md5.new(page).hexdigest() + ".pspc")
+        if os.path.exists(cached):
+            os.remove(cached)
+
+        for i in range(2):
+            rsp = self.vhost_get("test_psp_cache_dir", path="/psptest.psp")
+            if (rsp[-8:] != "test ok\n"):
+                self.fail(`rsp`)
+
+        if not os.path.exists(cached):
+            self.fail("The code of the page was not cached in %s" % TMP_DIR)
+
     def test_psp_parser_conf(self):
 
         c = VirtualHost("*",
@@ -2052,6 +2525,107 @@ class PerRequestTestCase(unittest.TestCase):
         if (rsp.strip().split() != ["okay","fail"]):
             self.fail(`rsp`)
 
+    def test_psp_cache_stats_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_psp_cache_stats"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::psp_cache_stats"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_psp_cache_stats(self):
+
+        print "\n  * Testing mod_python.psp memory cache statistics"
+
+        rsp = self.vhost_get("test_psp_cache_stats")
+        if (rsp != "test ok"):
+            self.fail(`rsp`)
+
+    def test_psp_globals_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_psp_globals"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::psp_globals"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_psp_globals(self):
+
+        print "\n  * Testing the mod_python.psp globals seen by pages"
+
+        rsp = self.vhost_get("test_psp_globals")
+        if (rsp != "&lt; True"):
+            self.fail(`rsp`)
+
+    def test_psp_compiled_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_psp_compiled"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::psp_compiled"),
+                                  PythonOption("psp_compiled_dir %s" %
+                                               os.path.join(TMP_DIR, "psp_compiled")),
+                                  PythonDebug("On")))
+        return c
+
+    def test_psp_compiled(self):
+
+        print "\n  * Testing the compile-psp command of the mod_python script"
+
+        script = os.path.join(TESTHOME, "..", "scripts", "mod_python")
+        cmd = "%s %s compile-psp " % (quote_if_space(mod_python.version.PYTHON_BIN),
+                                      quote_if_space(script))
+
+        dir = os.path.join(TMP_DIR, "psp_compiled")
+        if os.path.exists(dir):
+            shutil.rmtree(dir)
+        os.mkdir(dir)
+        names = [name for name in os.listdir(DOCUMENT_ROOT) if name.endswith(".psp")]
+        names.sort()
+        for name in names:
+            shutil.copy(os.path.join(DOCUMENT_ROOT, name), dir)
+
+        status, output = commands.getstatusoutput(cmd + quote_if_space(dir))
+        if status != 0 or output.find("%d compiled, 0 failed" % len(names)) == -1:
+            self.fail(output)
+
+        # the templates are loaded by psp from the .psc files
+        rsp = self.vhost_get("test_psp_compiled")
+        if (rsp != " ".join(names)):
+            self.fail(`rsp`)
+
+        missing = os.path.join(dir, "missing")
+        status, output = commands.getstatusoutput(cmd + quote_if_space(missing))
+        if status == 0 or output.find("%s is not a directory" % missing) == -1:
+            self.fail(output)
+
+    def test_psp_cache_lru_conf(self):
+
+        c = VirtualHost("*",
+                        ServerName("test_psp_cache_lru"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("tests::psp_cache_lru"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_psp_cache_lru(self):
+
+        print "\n  * Testing mod_python.psp memory cache eviction"
+
+        rsp = self.vhost_get("test_psp_cache_lru")
+        if (rsp != "test ok"):
+            self.fail(`rsp`)
+
     def test_Cookie_Cookie_conf(self):
 
         c = VirtualHost("*",
@@ -2512,6 +3086,48 @@ class PerRequestTestCase(unittest.TestCase):
         if status != 403:
             self.fail('Vulnerability : built-in type publishing (%i)\n%s' % (status, response))
 
+    def test_publisher_form_conf(self):
+        c = Container(VirtualHost("*",
+                                  ServerName("test_publisher_form"),
+                                  DocumentRoot(DOCUMENT_ROOT),
+                                  Directory(DOCUMENT_ROOT,
+                                            SetHandler("mod_python"),
+                                            PythonHandler("mod_python.publisher"),
+                                            PythonDebug("On"))),
+                      VirtualHost("*",
+                                  ServerName("test_publisher_form_lazy"),
+                                  DocumentRoot(DOCUMENT_ROOT),
+                                  Directory(DOCUMENT_ROOT,
+                                            SetHandler("mod_python"),
+                                            PythonHandler("mod_python.publisher"),
+                                            PythonOption("mod_python.form.lazy On"),
+                                            PythonDebug("On"))))
+        return c
+
+    def test_publisher_form(self):
+        print "\n  * Testing mod_python.publisher form arguments"
+
+        def post(vhost):
+            headers = {"Host": vhost,
+                       "Content-type": "application/x-www-form-urlencoded"}
+            conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+            conn.request("POST", "/tests.py/test_publisher_form?spam=5",
+                         "spam=1", headers)
+            response = conn.getresponse()
+            rsp = response.read()
+            conn.close()
+            return rsp
+
+        # the values in the query string and the body
+        rsp = post("test_publisher_form")
+        if (rsp != "list 5 1"):
+            self.fail(`rsp`)
+
+        # unless the form is lazy, which only looks at the query string
+        rsp = post("test_publisher_form_lazy")
+        if (rsp != "StringField 5"):
+            self.fail(`rsp`)
+
     def test_publisher_iterator_conf(self):
         c = VirtualHost("*",
                         ServerName("test_publisher"),
@@ -2525,14 +3141,33 @@ class PerRequestTestCase(unittest.TestCase):
     def test_publisher_iterator(self):
         print "\n  * Testing mod_python.publisher iterators"
 
+        # lists are published as a whole, as they always were
         rsp = self.vhost_get("test_publisher", path="/tests.py/test_dict_iteration")
-        if (rsp != "123"):
+        if (rsp != "[1, 2, 3]"):
             self.fail(`rsp`)
 
         rsp = self.vhost_get("test_publisher", path="/tests.py/test_generator")
         if (rsp != "0123456789"):
             self.fail(`rsp`)
 
+    def test_publisher_flush_conf(self):
+        c = VirtualHost("*",
+                        ServerName("test_publisher_flush"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("mod_python.publisher"),
+                                  PythonOption("mod_python.publisher.flush_size 5"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_publisher_flush(self):
+        print "\n  * Testing mod_python.publisher flush_size"
+
+        rsp = self.vhost_get("test_publisher_flush", path="/tests.py/test_publisher_flush")
+        if (rsp != "aaabb 1"):
+            self.fail(`rsp`)
+
     def test_publisher_hierarchy_conf(self):
         c = VirtualHost("*",
                         ServerName("test_publisher_hierarchy"),
@@ -2678,6 +3313,128 @@ class PerRequestTestCase(unittest.TestCase):
         finally:
             os.remove('htdocs/temp.py')
 
+    def test_publisher_route_cache_conf(self):
+        c = VirtualHost("*",
+                        ServerName("test_publisher_route_cache"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("mod_python.publisher"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_publisher_route_cache(self):
+
+        print "\n  * Testing mod_python.publisher route cache"
+
+        def get(path):
+            conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+            conn.putrequest("GET", path, skip_host=1)
+            conn.putheader("Host", "test_publisher_route_cache:%s" % PORT)
+            conn.endheaders()
+            response = conn.getresponse()
+            rsp = response.status, response.read()
+            conn.close()
+            return rsp
+
+        # the same missing page and object, twice
+        for i in range(2):
+            status, rsp = get("/route_temp.py/hello")
+            if status != 404:
+                self.fail(`(status, rsp)`)
+            status, rsp = get("/index.py/nosuchfunction")
+            if status != 404:
+                self.fail(`(status, rsp)`)
+
+        published = file('htdocs/route_temp.py','wb')
+        published.write('def hello(req):\n')
+        published.write('    return "hello"\n')
+        published.close()
+
+        try:
+            rsp = get("/route_temp.py/hello")
+            if rsp != (200, "hello"):
+                self.fail(`rsp`)
+        finally:
+            os.remove('htdocs/route_temp.py')
+
+        status, rsp = get("/route_temp.py/hello")
+        if status != 404:
+            self.fail(`(status, rsp)`)
+
+    def test_publisher_code_cache_conf(self):
+        c = VirtualHost("*",
+                        ServerName("test_publisher_code_cache"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("mod_python.publisher"),
+                                  PythonOption("mod_python.publisher.code_cache_dir %s" % TMP_DIR),
+                                  PythonOption("mod_python.publisher.stat_interval 1"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_publisher_code_cache(self):
+
+        print "\n  * Testing mod_python.publisher code cache"
+
+        import md5
+        page = os.path.normpath(os.path.join(DOCUMENT_ROOT, "index.py"))
+        cached = os.path.join(TMP_DIR, md5.new(page).hexdigest() + ".pyc")
+        if os.path.exists(cached):
+            os.remove(cached)
+
+        for i in range(2):
+            rsp = self.vhost_get("test_publisher_code_cache", path="/index.py")
+            if not rsp.startswith("test 1 ok"):
+                self.fail(`rsp`)
+
+        if not os.path.exists(cached):
+            self.fail("The code of the page was not cached in %s" % TMP_DIR)
+
+    def test_publisher_auth_cache_conf(self):
+        c = VirtualHost("*",
+                        ServerName("test_publisher_auth_cache"),
+                        DocumentRoot(DOCUMENT_ROOT),
+                        Directory(DOCUMENT_ROOT,
+                                  SetHandler("mod_python"),
+                                  PythonHandler("mod_python.publisher"),
+                                  PythonOption("mod_python.publisher.auth_cache_ttl 60"),
+                                  PythonDebug("On")))
+        return c
+
+    def test_publisher_auth_cache(self):
+
+        print "\n  * Testing mod_python.publisher auth cache"
+
+        # requests on the same (keep-alive) connection are handled
+        # by the same process, which remembers a successful __auth__
+        conn = httplib.HTTPConnection("127.0.0.1:%s" % PORT)
+
+        def get(passwd):
+            conn.putrequest("GET", "/tests.py/test_publisher_auth_cache", skip_host=1)
+            conn.putheader("Host", "test_publisher_auth_cache:%s" % PORT)
+            auth = base64.encodestring("spam:%s" % passwd).strip()
+            conn.putheader("Authorization", "Basic %s" % auth)
+            conn.endheaders()
+            response = conn.getresponse()
+            return response.status, response.read()
+
+        try:
+            status, first = get("eggs")
+            if status != 200:
+                self.fail(`(status, first)`)
+
+            status, rsp = get("BAD PASSWD")
+            if status != 401:
+                self.fail(`(status, rsp)`)
+
+            rsp = get("eggs")
+            if rsp != (200, str(int(first) + 1)):
+                self.fail("__auth__ was called again: %s" % `(first, rsp)`)
+        finally:
+            conn.close()
+
     def test_server_side_include_conf(self):
         c = VirtualHost("*",
                         ServerName("test_server_side_include"),
@@ -2834,6 +3591,87 @@ class PerInstanceTestCase(unittest.TestCase, HttpdCtrl):
         if (t2 - t1) < 5:
             self.fail("global_lock is broken (too quick)")
 
+    def test_dispatch_benchmark(self):
+
+        print "\n* Benchmarking handler dispatch"
+
+        if not get_ab_path():
+            print "    Can't find ab. Skipping dispatch benchmark"
+            return
+
+        # a content handler and four more Python handlers for
+        # other phases, creating a thread state for every
+        # dispatch as before and reusing them
+        c = Directory(DOCUMENT_ROOT,
+                      SetHandler("mod_python"),
+                      Directive("PythonHeaderParserHandler", "tests::noop"),
+                      PythonAccessHandler("tests::noop"),
+                      PythonFixupHandler("tests::noop"),
+                      Directive("PythonLogHandler", "tests::noop"),
+                      PythonHandler("tests::okay"))
+        self.makeConfig(c)
+
+        times = []
+        for extra in ("-DPYTHON_NO_TSTATE_CACHE", ""):
+            self.startHttpd(extra)
+            # warm up, then measure
+            ab_time_per_request("/tests.py", n=200)
+            times.append(ab_time_per_request("/tests.py"))
+            self.stopHttpd()
+
+        if None in times:
+            self.fail("Could not get the time per request from ab")
+
+        print "    new thread states:    %.3f ms per request" % times[0]
+        print "    reused thread states: %.3f ms per request" % times[1]
+        print "    => %.1f us saved per dispatch" % ((times[0] - times[1]) * 1000 / 5)
+
+    def test_multipart_benchmark(self):
+
+        print "\n* Benchmarking multipart/form-data parsing"
+
+        if not get_ab_path():
+            print "    Can't find ab. Skipping multipart benchmark"
+            return
+
+        # a 10MB binary upload and a small field
+        boundary = "----------ThIs_Is_tHe_bouNdaRY_$"
+        data = open("/dev/urandom", "rb").read(10 * 1024 * 1024)
+        body = ("--%s\r\n"
+                "Content-Disposition: form-data; name=\"field\"\r\n\r\n"
+                "value\r\n"
+                "--%s\r\n"
+                "Content-Disposition: form-data; name=\"file\"; filename=\"data.bin\"\r\n"
+                "Content-Type: application/octet-stream\r\n\r\n"
+                "%s\r\n"
+                "--%s--\r\n") % (boundary, boundary, data, boundary)
+        postfile = os.path.join(TMP_DIR, "multipart_benchmark.txt")
+        f = open(postfile, "wb")
+        f.write(body)
+        f.close()
+        ctype = "multipart/form-data; boundary=%s" % boundary
+
+        # the C parser, then the line by line one
+        times = []
+        for handler in ("tests::util_fieldstorage_upload",
+                        "tests::util_fieldstorage_upload_lines"):
+            self.makeConfig(Directory(DOCUMENT_ROOT,
+                                      SetHandler("mod_python"),
+                                      PythonHandler(handler)))
+            self.startHttpd()
+            ab_time_per_request("/tests.py", n=2, c=1, postfile=postfile, ctype=ctype)
+            times.append(ab_time_per_request("/tests.py", n=20, c=1,
+                                             postfile=postfile, ctype=ctype))
+            self.stopHttpd()
+
+        os.remove(postfile)
+
+        if None in times:
+            self.fail("Could not get the time per request from ab")
+
+        print "    C parser:            %.1f ms per 10MB upload" % times[0]
+        print "    line by line parser: %.1f ms per 10MB upload" % times[1]
+
     def testPerRequestTests(self):
 
         print "\n* Running the per-request test suite..."
@@ -2855,14 +3693,18 @@ class PerInstanceTestCase(unittest.TestCase, HttpdCtrl):
         perRequestSuite.addTest(PerRequestTestCase("test_req_internal_redirect"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_construct_url"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_read"))
+        perRequestSuite.addTest(PerRequestTestCase("test_req_readinto"))
+        perRequestSuite.addTest(PerRequestTestCase("test_req_iter_body"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_readline"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_readlines"))
+        perRequestSuite.addTest(PerRequestTestCase("test_req_iterate"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_discard_request_body"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_register_cleanup"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_headers_out"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_sendfile"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_sendfile2"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_sendfile3"))
+        perRequestSuite.addTest(PerRequestTestCase("test_req_write_buffer"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_handler"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_no_cache"))
         perRequestSuite.addTest(PerRequestTestCase("test_req_update_mtime"))
@@ -2877,6 +3719,13 @@ class PerInstanceTestCase(unittest.TestCase, HttpdCtrl):
         perRequestSuite.addTest(PerRequestTestCase("test_PythonOption_remove"))
         perRequestSuite.addTest(PerRequestTestCase("test_PythonOption_remove2"))
         perRequestSuite.addTest(PerRequestTestCase("test_util_fieldstorage"))
+        perRequestSuite.addTest(PerRequestTestCase("test_util_fieldstorage_boundary"))
+        perRequestSuite.addTest(PerRequestTestCase("test_util_fieldstorage_chunked"))
+        perRequestSuite.addTest(PerRequestTestCase("test_util_fieldstorage_mapping"))
+        perRequestSuite.addTest(PerRequestTestCase("test_util_fieldstorage_lazy"))
+        perRequestSuite.addTest(PerRequestTestCase("test_util_fieldstorage_limits"))
+        perRequestSuite.addTest(PerRequestTestCase("test_util_apply_fs_data"))
+        perRequestSuite.addTest(PerRequestTestCase("test_util_fieldstorage_spool"))
         perRequestSuite.addTest(PerRequestTestCase("test_postreadrequest"))
         perRequestSuite.addTest(PerRequestTestCase("test_trans"))
         perRequestSuite.addTest(PerRequestTestCase("test_outputfilter"))
@@ -2884,17 +3733,25 @@ class PerInstanceTestCase(unittest.TestCase, HttpdCtrl):
         perRequestSuite.addTest(PerRequestTestCase("test_req_register_output_filter"))
         perRequestSuite.addTest(PerRequestTestCase("test_connectionhandler"))
         perRequestSuite.addTest(PerRequestTestCase("test_import"))
+        perRequestSuite.addTest(PerRequestTestCase("test_import_module_threads"))
         perRequestSuite.addTest(PerRequestTestCase("test_pipe_ext"))
         perRequestSuite.addTest(PerRequestTestCase("test_cgihandler"))
         perRequestSuite.addTest(PerRequestTestCase("test_psphandler"))
+        perRequestSuite.addTest(PerRequestTestCase("test_psp_cache_dir"))
         perRequestSuite.addTest(PerRequestTestCase("test_psp_parser"))
         perRequestSuite.addTest(PerRequestTestCase("test_psp_error"))
+        perRequestSuite.addTest(PerRequestTestCase("test_psp_cache_stats"))
+        perRequestSuite.addTest(PerRequestTestCase("test_psp_cache_lru"))
+        perRequestSuite.addTest(PerRequestTestCase("test_psp_globals"))
+        perRequestSuite.addTest(PerRequestTestCase("test_psp_compiled"))
         perRequestSuite.addTest(PerRequestTestCase("test_Cookie_Cookie"))
         perRequestSuite.addTest(PerRequestTestCase("test_Cookie_MarshalCookie"))
         perRequestSuite.addTest(PerRequestTestCase("test_Session_Session"))
         perRequestSuite.addTest(PerRequestTestCase("test_Session_illegal_sid"))
         perRequestSuite.addTest(PerRequestTestCase("test_interpreter_per_directive"))
         perRequestSuite.addTest(PerRequestTestCase("test_interpreter_per_directory"))
+        perRequestSuite.addTest(PerRequestTestCase("test_dispatch_plan"))
+        perRequestSuite.addTest(PerRequestTestCase("test_watcher"))
         perRequestSuite.addTest(PerRequestTestCase("test_files_directive"))
         perRequestSuite.addTest(PerRequestTestCase("test_none_handler"))
         perRequestSuite.addTest(PerRequestTestCase("test_server_return"))
@@ -2906,8 +3763,13 @@ class PerInstanceTestCase(unittest.TestCase, HttpdCtrl):
         perRequestSuite.addTest(PerRequestTestCase("test_publisher_old_style_instance"))
         perRequestSuite.addTest(PerRequestTestCase("test_publisher_instance"))
         perRequestSuite.addTest(PerRequestTestCase("test_publisher_security"))
-        # perRequestSuite.addTest(PerRequestTestCase("test_publisher_iterator"))
+        perRequestSuite.addTest(PerRequestTestCase("test_publisher_iterator"))
+        perRequestSuite.addTest(PerRequestTestCase("test_publisher_flush"))
+        perRequestSuite.addTest(PerRequestTestCase("test_publisher_form"))
         perRequestSuite.addTest(PerRequestTestCase("test_publisher_hierarchy"))
+        perRequestSuite.addTest(PerRequestTestCase("test_publisher_route_cache"))
+        perRequestSuite.addTest(PerRequestTestCase("test_publisher_code_cache"))
+        perRequestSuite.addTest(PerRequestTestCase("test_publisher_auth_cache"))
         perRequestSuite.addTest(PerRequestTestCase("test_server_side_include"))
         if APACHE_VERSION == '2.4' and sys.platform.startswith("linux"):
             perRequestSuite.addTest(PerRequestTestCase("test_memory"))
@@ -3033,6 +3895,16 @@ def suite():
     mpTestSuite.addTest(PerInstanceTestCase("testPerRequestTests"))
     return mpTestSuite
 
+def benchmark_suite():
+
+    mpBenchSuite = unittest.TestSuite()
+    mpBenchSuite.addTest(PerInstanceTestCase("test_dispatch_benchmark"))
+    mpBenchSuite.addTest(PerInstanceTestCase("test_multipart_benchmark"))
+    return mpBenchSuite
+
 tr = unittest.TextTestRunner()
-tr.run(suite())
+if "bench" in sys.argv[1:]:
+    tr.run(benchmark_suite())
+else:
+    tr.run(suite())
 